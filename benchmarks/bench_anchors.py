@@ -0,0 +1,71 @@
+"""
+Billing-anchor arithmetic in utils.py: micro-benchmark of the closed-form
+functions against reference copies of the previous relativedelta /
+month-by-month implementations. tests/test_anchors.py checks that both agree.
+
+    python -m benchmarks.bench_anchors [--calls 20000]
+"""
+import argparse
+import timeit
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+import utils
+
+
+# ---------- Reference implementation (before the closed-form rewrite) ----------
+def ref_days_in_month(y: int, m: int) -> int:
+    if m == 12:
+        nxt = date(y + 1, 1, 1)
+    else:
+        nxt = date(y, m + 1, 1)
+    return (nxt - date(y, m, 1)).days
+
+def ref_add_months_anchor(anchor_date: date, months: int, billing_day: int) -> date:
+    target = anchor_date + relativedelta(months=+months)
+    return target.replace(day=min(billing_day, ref_days_in_month(target.year, target.month)))
+
+def ref_next_billing_start(last_covered_until: date, billing_day: int) -> date:
+    candidate = date(last_covered_until.year, last_covered_until.month, 1)
+    curr_anchor = candidate.replace(day=min(billing_day, ref_days_in_month(candidate.year, candidate.month)))
+    if last_covered_until < curr_anchor:
+        return curr_anchor
+    d = curr_anchor
+    while d <= last_covered_until:
+        d = ref_add_months_anchor(d, 1, billing_day)
+    return d
+
+def ref_compute_coverage_until(last_payment_date: date, months: int, billing_day: int) -> date:
+    first_anchor = date(last_payment_date.year, last_payment_date.month, 1)
+    first_anchor = first_anchor.replace(day=min(billing_day, ref_days_in_month(first_anchor.year, first_anchor.month)))
+    if last_payment_date < first_anchor:
+        start = first_anchor
+    else:
+        start = ref_add_months_anchor(first_anchor, 1, billing_day)
+    return ref_add_months_anchor(start, months, billing_day) - timedelta(days=1)
+
+
+# ---------- Micro-benchmark ----------
+def bench(calls: int):
+    far = date(2026, 3, 31)  # coverage paid far ahead
+    covered = ref_compute_coverage_until(far, 24, 31)
+    cases = [
+        ("next_billing_start (24 mo ahead)", lambda f: f(covered, 31),
+         ref_next_billing_start, utils.next_billing_start),
+        ("add_months_anchor (+24)", lambda f: f(far, 24, 31),
+         ref_add_months_anchor, utils.add_months_anchor),
+        ("compute_coverage_until (24 mo)", lambda f: f(far, 24, 31),
+         ref_compute_coverage_until, utils.compute_coverage_until),
+        ("days_in_month", lambda f: f(2024, 2), ref_days_in_month, utils.days_in_month),
+    ]
+    for name, call, ref, new in cases:
+        old_us = timeit.timeit(lambda: call(ref), number=calls) / calls * 1e6
+        new_us = timeit.timeit(lambda: call(new), number=calls) / calls * 1e6
+        print(f"  {name:<34} old={old_us:7.2f}us  new={new_us:6.2f}us  {old_us / new_us:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    bench(parser.parse_args().calls)
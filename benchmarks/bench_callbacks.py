@@ -0,0 +1,87 @@
+"""
+Per-callback dispatch cost as the number of menu actions grows: one aiogram
+handler per action (`F.data == ...` filters checked in turn) versus the single
+handler backed by callbacks.CallbackRouter. Updates go through
+Dispatcher.feed_update with no-op handlers, so the numbers are routing only.
+
+    python -m benchmarks.bench_callbacks [--routes 10 50 200] [--updates 5000]
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from callbacks import CallbackRouter, pack
+
+
+async def _noop(callback: CallbackQuery, *args):
+    pass
+
+
+def _filters_dispatcher(names: list) -> Dispatcher:
+    dp = Dispatcher()
+    for name in names:
+        dp.callback_query(F.data == name)(_noop)
+    dp.callback_query(F.data.startswith("page:"))(_noop)
+    return dp
+
+
+def _router_dispatcher(names: list) -> Dispatcher:
+    dp = Dispatcher()
+    router = CallbackRouter()
+    for name in names:
+        router.action(name)(_noop)
+    router.action("page", str, int, int)(_noop)
+    dp.callback_query()(router.dispatch)
+    return dp
+
+
+def _updates(names: list, count: int) -> list:
+    rng = random.Random(5)
+    user = User(id=42, is_bot=False, first_name="Member")
+    message = Message(message_id=1, date=datetime.now(timezone.utc), chat=Chat(id=42, type="private"))
+    updates = []
+    for i in range(count):
+        if rng.random() < 0.2:
+            data = pack("page", "n", 1700000000 + i, i)
+        else:
+            data = rng.choice(names)
+        query = CallbackQuery(id=str(i), from_user=user, chat_instance="bench", message=message, data=data)
+        updates.append(Update(update_id=i, callback_query=query))
+    return updates
+
+
+async def _timed(dp: Dispatcher, bot: Bot, updates: list) -> float:
+    for update in updates[:100]:  # warm-up
+        await dp.feed_update(bot, update)
+    start = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return time.perf_counter() - start
+
+
+async def main(route_counts: list, count: int):
+    bot = Bot(token="123456:offline-benchmark-token")
+    print(f"{count} callback updates per run (80% menu actions, 20% paged with args)")
+    print(f"{'routes':>7}  {'filters':>12}  {'router':>12}")
+    try:
+        for routes in route_counts:
+            names = [f"menu_{i}" for i in range(routes)]
+            updates = _updates(names, count)
+            old = await _timed(_filters_dispatcher(names), bot, updates)
+            new = await _timed(_router_dispatcher(names), bot, updates)
+            print(f"{routes:>7}  {old / count * 1e6:9.1f} µs  {new / count * 1e6:9.1f} µs  {old / new:5.1f}x")
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--routes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--updates", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.routes, args.updates))
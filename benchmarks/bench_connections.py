@@ -0,0 +1,74 @@
+"""
+Per-call latency of database reads/writes: a fresh aiosqlite.connect() per call
+(the old pattern) versus the shared connection pool opened by init_db().
+
+    python -m benchmarks.bench_connections [--calls 2000]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite
+
+import database as db
+
+
+async def _old_get_user(user_id: int):
+    async with aiosqlite.connect(db.DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        cursor = await conn.execute(
+            "SELECT user_id, username, first_name, last_name, muted_until FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+
+async def _old_set_pending(user_id: int, amount: float, months: int):
+    async with aiosqlite.connect(db.DB_PATH) as conn:
+        await conn.execute(
+            "INSERT OR REPLACE INTO pending_payments (user_id, amount, months) VALUES (?, ?, ?)",
+            (user_id, amount, months)
+        )
+        await conn.commit()
+
+
+async def _time_calls(fn, calls: int) -> list:
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await fn(i % 100 + 1)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _report(name: str, samples: list):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<32} p50={p50:8.1f}us  p95={p95:8.1f}us  mean={statistics.fmean(samples):8.1f}us")
+
+
+async def main(calls: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        await db.init_db()
+        for uid in range(1, 101):
+            await db.upsert_user(uid, f"user{uid}", "First", "Last")
+
+        _report("get_user (connect per call)", await _time_calls(_old_get_user, calls))
+        _report("get_user (pooled)", await _time_calls(db.get_user, calls))
+        _report("set_pending (connect per call)",
+                await _time_calls(lambda uid: _old_set_pending(uid, 2.5, 1), calls // 4))
+        _report("set_pending (pooled)",
+                await _time_calls(lambda uid: db.set_pending(uid, 2.5, 1), calls // 4))
+        await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    asyncio.run(main(parser.parse_args().calls))
@@ -0,0 +1,110 @@
+"""
+Bulk coverage computation: the scalar per-payment fold (compute_coverage_until
+and next_billing_start per payment, as the status views and users_due used to
+do) versus the vectorized engine in utils (coverage_arrays), then the full
+rebuild_coverage() on a database of the same size. Results are checked to be
+identical.
+
+    python -m benchmarks.bench_coverage [--users 100000] [--payments 1000000] [--skip-db]
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import database as db
+from utils import compute_coverage_until, coverage_arrays, latest_per_group, next_billing_start
+
+BILLING_DAY = 5
+
+
+def synthetic_payments(users: int, payments: int, seed: int = 7) -> list:
+    """(user_id, id, paid_at, months) rows sorted like the coverage scan: user, newest first."""
+    rng = random.Random(seed)
+    start = date(2021, 1, 1)
+    rows = []
+    for pid in range(1, payments + 1):
+        paid = start + timedelta(days=rng.randint(0, 1500))
+        rows.append((rng.randint(1, users), pid, f"{paid.isoformat()}T12:00:00", rng.choice((1, 1, 1, 3, 6, 12, 24))))
+    rows.sort(key=lambda r: (r[0], r[2], r[1]), reverse=True)
+    rows.sort(key=lambda r: r[0])
+    return rows
+
+
+def scalar_fold(rows: list) -> dict:
+    by_user = {}
+    for user_id, payment_id, paid_at, months in rows:
+        by_user.setdefault(user_id, []).append((paid_at, payment_id, months))
+    result = {}
+    for user_id, payments in by_user.items():
+        covered = None
+        for paid_at, _, months in sorted(payments):
+            covered = compute_coverage_until(date.fromisoformat(paid_at[:10]), months, BILLING_DAY)
+        result[user_id] = (covered.isoformat(), next_billing_start(covered, BILLING_DAY).isoformat())
+    return result
+
+
+def vectorized(rows: list) -> dict:
+    user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    idx = np.flatnonzero(latest_per_group(user_ids))
+    paid = np.array([rows[i][2][:10] for i in idx], dtype="datetime64[D]")
+    months = np.fromiter((rows[i][3] for i in idx), dtype=np.int64, count=len(idx))
+    covered, next_due = coverage_arrays(paid, months, BILLING_DAY)
+    return dict(zip(user_ids[idx].tolist(), zip(covered.astype(str).tolist(), next_due.astype(str).tolist())))
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+async def bench_db(rows: list, users: int, expected: dict):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        await db.init_db(BILLING_DAY)
+        try:
+            async def op(conn):
+                await conn.executemany(
+                    "INSERT INTO users (user_id, username) VALUES (?, ?)",
+                    ((uid, f"user{uid}") for uid in range(1, users + 1))
+                )
+                await conn.executemany(
+                    "INSERT INTO payments (id, user_id, amount, months, proof_file_id, paid_at) VALUES (?, ?, 2.5, ?, 'file', ?)",
+                    ((pid, uid, months, paid_at) for uid, pid, paid_at, months in rows)
+                )
+            await db._submit(op)
+            start = time.perf_counter()
+            covered = await db.rebuild_coverage(BILLING_DAY)
+            print(f"  rebuild_coverage():      {time.perf_counter() - start:8.2f}s ({covered} users)")
+            stored = {c["user_id"]: (c["covered_through"], c["next_due"])
+                      for c in await db.all_users_with_coverage() if c["next_due"]}
+            assert stored == expected, "rebuild_coverage disagrees with the scalar functions"
+        finally:
+            await db.close_db()
+
+
+def main(users: int, payments: int, skip_db: bool):
+    rows = synthetic_payments(users, payments)
+    print(f"{users} users, {payments} payments, billing day {BILLING_DAY}")
+    scalar_time, expected = _timed(scalar_fold, rows)
+    vector_time, actual = _timed(vectorized, rows)
+    assert actual == expected, "vectorized coverage disagrees with the scalar functions"
+    print(f"  scalar per-payment fold: {scalar_time:8.2f}s")
+    print(f"  vectorized pass:         {vector_time:8.2f}s  ({scalar_time / vector_time:.1f}x, results identical)")
+    if not skip_db:
+        asyncio.run(bench_db(rows, users, expected))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--payments", type=int, default=1000000)
+    parser.add_argument("--skip-db", action="store_true")
+    args = parser.parse_args()
+    main(args.users, args.payments, args.skip_db)
@@ -0,0 +1,61 @@
+"""
+Daily reminder job cost against total user count on synthetic databases
+(benchmarks/synthetic.py): the previous full pass (every user's coverage row,
+filtered in Python) versus scheduler.users_due reading only due rows from
+idx_coverage_next_due.
+
+    python -m benchmarks.bench_due_index [--users 10000 100000 500000]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import database as db
+from benchmarks.synthetic import BILLING_DAY, populate
+from coverage_service import CoverageStatus
+from scheduler import users_due
+
+TZ = ZoneInfo("Europe/Chisinau")
+
+
+async def _full_pass(billing_day: int, tz: ZoneInfo) -> list:
+    today = datetime.now(tz).date()
+    return [
+        row["user_id"] for row in await db.all_users_with_coverage()
+        if CoverageStatus.from_row(row).is_due(today, billing_day)
+    ]
+
+
+async def _timed(fn, repeat: int = 5) -> tuple:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await fn(BILLING_DAY, TZ)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+async def main(user_counts: list):
+    print(f"{'users':>8} {'due':>7} {'full pass (ms)':>15} {'indexed (ms)':>13} {'speedup':>8}")
+    for users in user_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.db"
+            await db.init_db(BILLING_DAY)
+            try:
+                await populate(users)
+                full_time, full_ids = await _timed(_full_pass)
+                index_time, index_ids = await _timed(users_due)
+                assert sorted(full_ids) == sorted(index_ids), "due sets differ"
+                print(f"{users:>8} {len(index_ids):>7} {full_time * 1000:>15.1f} {index_time * 1000:>13.2f} {full_time / index_time:>7.0f}x")
+            finally:
+                await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 500000])
+    asyncio.run(main(parser.parse_args().users))
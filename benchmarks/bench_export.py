@@ -0,0 +1,80 @@
+"""
+Peak Python memory and wall time of the payments CSV export: the old
+list -> StringIO -> BytesIO pipeline versus the streaming build_export(),
+on synthetic databases (benchmarks/synthetic.py).
+
+    python -m benchmarks.bench_export [--users 1000 10000 30000]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# bot.py refuses to import without credentials; nothing here talks to Telegram.
+os.environ.setdefault("BOT_TOKEN", "123456:offline-benchmark-token")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import database as db
+import bot
+from benchmarks.synthetic import BILLING_DAY, populate
+
+
+async def _old_export() -> int:
+    async with db._read() as conn:
+        cursor = await conn.execute("""
+            SELECT p.id, p.user_id, u.username, u.first_name, u.last_name,
+                   p.amount, p.months, p.proof_file_id, p.paid_at
+            FROM payments p
+            JOIN users u ON p.user_id = u.user_id
+            ORDER BY p.created_at DESC
+        """)
+        rows = [tuple(row) for row in await cursor.fetchall()]
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(bot.EXPORT_HEADER)
+    writer.writerows(rows)
+    data = io.BytesIO(output.getvalue().encode("utf-8"))
+    return len(data.getvalue())
+
+
+async def _new_export(compress: bool) -> int:
+    data, _ = await bot.build_export(compress)
+    with data:
+        data.seek(0, io.SEEK_END)
+        return data.tell()
+
+
+async def _measure(name: str, fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = await fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<16} peak={peak / 1e6:8.2f} MB  time={elapsed:6.2f}s  output={size / 1e6:7.2f} MB")
+
+
+async def main(user_counts: list):
+    for users in user_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.db"
+            await db.init_db(BILLING_DAY)
+            try:
+                payments = await populate(users)
+                print(f"{users} users, {payments} payments")
+                await _measure("old (in-memory)", _old_export)
+                await _measure("streaming csv", _new_export, False)
+                await _measure("streaming gzip", _new_export, True)
+            finally:
+                await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 30000])
+    asyncio.run(main(parser.parse_args().users))
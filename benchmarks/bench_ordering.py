@@ -0,0 +1,96 @@
+"""
+Update processing strategies on a mixed burst: members sending short
+sequences of updates (like /pay followed by the proof photo) while the admin
+runs slow reports. Handlers sleep instead of doing I/O, so the numbers are
+scheduling only.
+
+  serial     one update at a time
+  tasks      every update its own task, as aiogram does without a scheduler
+  scheduler  tasks behind update_scheduler.UpdateScheduler
+
+Reports wall time, p95 latency of member updates (all arrive at once), and
+how many member updates ran before an earlier update from the same member.
+
+    python -m benchmarks.bench_ordering [--users 200] [--per-user 5] [--slow 10] [--workers 16]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Chat, Message, Update, User
+
+from update_scheduler import UpdateScheduler
+
+ADMIN = 1
+SLOW_SECONDS = 0.3
+
+
+def _updates(users: int, per_user: int, slow: int) -> list:
+    rng = random.Random(11)
+    senders = [uid for uid in range(2, users + 2) for _ in range(per_user)] + [ADMIN] * slow
+    rng.shuffle(senders)
+    seq, updates = {}, []
+    for i, uid in enumerate(senders):
+        seq[uid] = seq.get(uid, 0) + 1
+        message = Message(message_id=i, date=datetime.now(timezone.utc), chat=Chat(id=uid, type="private"),
+                          from_user=User(id=uid, is_bot=False, first_name="U"), text=str(seq[uid]))
+        updates.append(Update(update_id=i, message=message))
+    return updates
+
+
+def _dispatcher(scheduler: UpdateScheduler = None):
+    dp = Dispatcher()
+    if scheduler is not None:
+        dp.update.outer_middleware(scheduler)
+    rng = random.Random(13)
+    seen, latencies = {}, []
+    out_of_order = [0]
+
+    @dp.message()
+    async def handle(message: Message, started: float):
+        uid = message.from_user.id
+        await asyncio.sleep(SLOW_SECONDS if uid == ADMIN else rng.uniform(0.001, 0.02))
+        if uid != ADMIN:
+            latencies.append(time.perf_counter() - started)
+            if int(message.text) < seen.get(uid, 0):
+                out_of_order[0] += 1
+            seen[uid] = max(seen.get(uid, 0), int(message.text))
+
+    return dp, latencies, out_of_order
+
+
+async def _run(mode: str, updates: list, workers: int):
+    bot = Bot(token="123456:offline-benchmark-token")
+    dp, latencies, out_of_order = _dispatcher(UpdateScheduler(workers) if mode == "scheduler" else None)
+    start = time.perf_counter()
+    if mode == "serial":
+        for update in updates:
+            await dp.feed_update(bot, update, started=start)
+    else:
+        await asyncio.gather(*(dp.feed_update(bot, u, started=start) for u in updates))
+    elapsed = time.perf_counter() - start
+    await bot.session.close()
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+    print(f"  {mode:<10} {elapsed:7.2f}s  member p95 {p95:8.1f} ms  out of order {out_of_order[0]}")
+
+
+async def main(users: int, per_user: int, slow: int, workers: int):
+    updates = _updates(users, per_user, slow)
+    print(f"{len(updates)} updates: {users} members x {per_user}, {slow} admin reports of {SLOW_SECONDS}s; "
+          f"{workers} workers")
+    for mode in ("serial", "tasks", "scheduler"):
+        await _run(mode, updates, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--slow", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.per_user, args.slow, args.workers))
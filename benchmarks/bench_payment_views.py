@@ -0,0 +1,66 @@
+"""
+Admin payment views: one get_user() per payment shown (the old way) versus
+db.list_payments_with_users, which joins the usernames into the page query.
+Pages the whole payment history of a synthetic database (benchmarks/synthetic.py).
+
+    python -m benchmarks.bench_payment_views [--users 10000] [--page 30] [--pages 50]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import database as db
+from benchmarks.synthetic import BILLING_DAY, populate
+
+
+async def _labels_per_row(size: int, before):
+    payments = await db.list_payments(None, size, before=before)
+    for p in payments:
+        user = await db.get_user(p["user_id"])
+        _ = f"@{user['username']}" if user and user["username"] else f"ID:{p['user_id']}"
+    return payments
+
+
+async def _joined(size: int, before):
+    payments = await db.list_payments_with_users(None, size, before=before)
+    for p in payments:
+        _ = f"@{p['username']}" if p["username"] else f"ID:{p['user_id']}"
+    return payments
+
+
+async def _walk(view, size: int, pages: int) -> float:
+    before = None
+    start = time.perf_counter()
+    for _ in range(pages):
+        payments = await view(size, before)
+        if not payments:
+            break
+        before = (payments[-1]["created_at"], payments[-1]["id"])
+    return time.perf_counter() - start
+
+
+async def main(users: int, size: int, pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "views.db"
+        await db.init_db(BILLING_DAY)
+        try:
+            payments = await populate(users)
+            print(f"{users} users, {payments} payments; {pages} pages of {size}")
+            await _walk(_joined, size, 2)  # warm-up
+            old = await _walk(_labels_per_row, size, pages)
+            new = await _walk(_joined, size, pages)
+        finally:
+            await db.close_db()
+    print(f"  get_user per row: {old / pages * 1000:8.2f} ms/page  ({size + 1} queries)")
+    print(f"  joined page:      {new / pages * 1000:8.2f} ms/page  (1 query)  {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--page", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.page, args.pages))
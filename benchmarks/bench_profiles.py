@@ -0,0 +1,69 @@
+"""
+ensure_member() cost per message: the old upsert + read-back on every update
+versus profile_cache.ProfileCache, for a stream of messages from a fixed set
+of members whose profiles rarely change.
+
+    python -m benchmarks.bench_profiles [--members 200] [--messages 20000] [--change-rate 0.01]
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import types
+
+import database as db
+from profile_cache import ProfileCache
+
+
+async def _old_ensure(u: types.User):
+    await db.upsert_user(u.id, u.username or "", u.first_name or "", u.last_name or "")
+    return await db.get_user(u.id)
+
+
+def _stream(members: int, messages: int, change_rate: float) -> list:
+    rng = random.Random(3)
+    names = {uid: f"user{uid}" for uid in range(1, members + 1)}
+    stream = []
+    for _ in range(messages):
+        uid = rng.randint(1, members)
+        if rng.random() < change_rate:
+            names[uid] = f"user{uid}_{rng.randint(0, 9999)}"
+        stream.append(types.User(id=uid, is_bot=False, first_name="Member", username=names[uid]))
+    return stream
+
+
+async def _timed(ensure, stream: list) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(ensure(u) for u in stream))
+    return time.perf_counter() - start
+
+
+async def main(members: int, messages: int, change_rate: float):
+    stream = _stream(members, messages, change_rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "bench.db"
+        await db.init_db()
+        try:
+            old = await _timed(_old_ensure, stream)
+            cache = ProfileCache()
+            db.add_write_listener(cache.on_write)
+            new = await _timed(cache.ensure, stream)
+        finally:
+            await db.close_db()
+    stats = cache.stats()
+    print(f"{messages} messages from {members} members, {change_rate:.0%} profile changes")
+    print(f"  upsert + read each: {old:6.2f}s  {messages / old:8.0f} msg/s  {messages} writes")
+    print(f"  ProfileCache:       {new:6.2f}s  {messages / new:8.0f} msg/s  {stats['writes']} writes "
+          f"({stats['writes_avoided']} avoided)  {old / new:.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--change-rate", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.messages, args.change_rate))
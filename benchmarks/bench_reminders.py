@@ -0,0 +1,71 @@
+"""
+Reminder delivery against the local fake Bot API (benchmarks/fake_bot_api.py):
+the old one-at-a-time loop versus reminders.dispatch(). Checks that every
+reachable chat got exactly one message, blocked chats were counted as
+failures, and the server's per-second limit held.
+
+    python -m benchmarks.bench_reminders [--chats 200] [--latency 0.1] [--blocked 3] [--skip-sequential]
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from reminders import dispatch
+
+TOKEN = "123456:offline-benchmark-token"
+
+
+async def _run(chats: int, latency: float, blocked: int, concurrent: bool):
+    server = FakeBotAPI(latency=latency, blocked=range(1, blocked + 1))
+    url = await server.start()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    chat_ids = list(range(1, chats + 1))
+
+    async def send(chat_id: int):
+        await bot.send_message(chat_id, "⏰ Payment reminder")
+
+    try:
+        start = time.perf_counter()
+        if concurrent:
+            stats = await dispatch(chat_ids, send)
+            failed = stats.failed
+        else:
+            failed = 0
+            for chat_id in chat_ids:
+                try:
+                    await send(chat_id)
+                except Exception:
+                    failed += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        await bot.session.close()
+        await server.stop()
+
+    assert failed == blocked, f"expected {blocked} failures, got {failed}"
+    assert all(server.delivered[c] == 1 for c in chat_ids[blocked:]), "a chat missed or repeated a message"
+    assert server.peak_per_second <= server.rate
+    name = "dispatch()" if concurrent else "sequential"
+    print(f"  {name:<11} {elapsed:7.2f}s  {(chats - blocked) / elapsed:6.1f} msg/s  "
+          f"429s={server.rejected_429} peak={server.peak_per_second}/s failed={failed}")
+
+
+async def main(chats: int, latency: float, blocked: int, skip_sequential: bool):
+    print(f"{chats} chats, {latency * 1000:.0f} ms API latency, {blocked} blocked")
+    if not skip_sequential:
+        await _run(chats, latency, blocked, concurrent=False)
+    await _run(chats, latency, blocked, concurrent=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--blocked", type=int, default=3)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.chats, args.latency, args.blocked, args.skip_sequential))
@@ -0,0 +1,54 @@
+"""
+Per-row memory of the row types returned by database.py: the old dict-per-row
+versus the __slots__ records (User, Payment, PendingPayment).
+
+    python -m benchmarks.bench_rows [--rows 100000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from database import Payment, PendingPayment, User
+
+SAMPLES = {
+    User: ("user_id", "username", "first_name", "last_name", "muted_until", "timezone"),
+    Payment: ("id", "user_id", "amount", "months", "proof_file_id", "paid_at", "created_at"),
+    PendingPayment: ("user_id", "amount", "months"),
+}
+
+
+def _raw_rows(record: type, rows: int) -> list:
+    if record is User:
+        return [(i, f"user{i}", "First", "Last", None, None) for i in range(rows)]
+    if record is Payment:
+        return [(i, i % 1000, 2.5, 1, "AgACAgIAAxkBAAI", "2024-01-05T10:00:00", "2024-01-05 10:00:00")
+                for i in range(rows)]
+    return [(i, 2.5, 1) for i in range(rows)]
+
+
+def _measure(build) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, elapsed
+
+
+def main(rows: int):
+    print(f"{rows} rows per type")
+    for record, columns in SAMPLES.items():
+        raw = _raw_rows(record, rows)
+        dict_size, dict_time = _measure(lambda: [dict(zip(columns, r)) for r in raw])
+        rec_size, rec_time = _measure(lambda: [record.row_factory(None, r) for r in raw])
+        print(f"  {record.__name__:<15} dict={dict_size / rows:6.1f} B/row ({dict_time:5.3f}s)  "
+              f"record={rec_size / rows:6.1f} B/row ({rec_time:5.3f}s)  "
+              f"saved={(dict_size - rec_size) / rows:6.1f} B/row")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    main(parser.parse_args().rows)
@@ -0,0 +1,57 @@
+"""
+Simulating a year of reminders: stepping simulate.ReminderSimulation day by
+day versus re-running the indexed due query (scheduler.users_due with an
+injected date) for every simulated day, on synthetic databases
+(benchmarks/synthetic.py). Checks that everyone the simulation reminds on a
+day is in that day's due set.
+
+    python -m benchmarks.bench_simulate [--users 10000 100000] [--days 365]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import database as db
+from benchmarks.synthetic import BILLING_DAY, populate
+from scheduler import users_due
+from simulate import simulate
+from utils import get_zone
+
+TZ = get_zone("Europe/Chisinau")
+START = date(2026, 1, 1)
+
+
+async def main(user_counts: list, days: int):
+    print(f"{days} simulated days from {START.isoformat()}")
+    print(f"{'users':>8} {'rescan (s)':>11} {'simulate (s)':>13} {'speedup':>8} {'reminders':>10}")
+    for users in user_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.db"
+            await db.init_db(BILLING_DAY)
+            try:
+                await populate(users, today=START)
+                start = time.perf_counter()
+                rescan = [set(await users_due(BILLING_DAY, TZ, today=START + timedelta(days=d))) for d in range(days)]
+                rescan_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                _, result, _ = await simulate(days, BILLING_DAY, START)
+                sim_time = time.perf_counter() - start
+
+                for d, due in zip(result, rescan):
+                    assert set(d.user_ids) <= due, f"{d.day}: reminded users that are not due"
+                total = sum(len(d.user_ids) for d in result)
+                print(f"{users:>8} {rescan_time:>11.2f} {sim_time:>13.2f} {rescan_time / sim_time:>7.0f}x {total:>10}")
+            finally:
+                await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.days))
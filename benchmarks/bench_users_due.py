@@ -0,0 +1,71 @@
+"""
+Wall time of scheduler.users_due against user count, compared with the old
+N+1 implementation (all_users() then list_payments() per user), on synthetic
+databases (benchmarks/synthetic.py).
+
+    python -m benchmarks.bench_users_due [--users 1000 5000 10000]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import database as db
+from benchmarks.synthetic import BILLING_DAY, populate
+from scheduler import users_due
+from utils import compute_coverage_until, iso_to_date, next_billing_start
+
+TZ = ZoneInfo("Europe/Chisinau")
+
+
+async def _old_users_due(billing_day: int, tz: ZoneInfo) -> list:
+    today_local = datetime.now(tz).date()
+    result = []
+    for u in await db.all_users():
+        if u["muted_until"] and today_local < iso_to_date(u["muted_until"]):
+            continue
+        payments = await db.list_payments(u["user_id"], limit=1000)
+        if not payments:
+            due = date(today_local.year, today_local.month, 1)
+            day = min(billing_day, (date(due.year, (due.month % 12)+1, 1) - date(due.year, due.month, 1)).days)
+            if today_local >= due.replace(day=day):
+                result.append(u["user_id"])
+            continue
+        last_covered = None
+        # ties on paid_at resolve to the newest payment, as in user_coverage
+        for p in sorted(payments, key=lambda p: (p["paid_at"], p["id"])):
+            last_covered = compute_coverage_until(iso_to_date(p["paid_at"]), int(p["months"]), billing_day)
+        if today_local >= next_billing_start(last_covered, billing_day):
+            result.append(u["user_id"])
+    return result
+
+
+async def _timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = await fn(BILLING_DAY, TZ)
+    return time.perf_counter() - start, result
+
+
+async def main(user_counts: list):
+    print(f"{'users':>8} {'N+1 (s)':>10} {'users_due (s)':>14} {'speedup':>8}")
+    for users in user_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_PATH = Path(tmp) / "bench.db"
+            await db.init_db(BILLING_DAY)
+            try:
+                await populate(users)
+                old_time, old_ids = await _timed(_old_users_due)
+                new_time, new_ids = await _timed(users_due)
+                assert sorted(old_ids) == sorted(new_ids), "users_due disagrees with the old implementation"
+                print(f"{users:>8} {old_time:>10.3f} {new_time:>14.3f} {old_time / new_time:>7.1f}x")
+            finally:
+                await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 5000, 10000])
+    asyncio.run(main(parser.parse_args().users))
@@ -0,0 +1,170 @@
+"""
+Query-plan regression check for database.py.
+
+Calls every public coroutine in database.py against a small seeded database,
+records each SQL statement it issues (via the sqlite trace callback) and runs
+EXPLAIN QUERY PLAN on it. Exits non-zero if a statement scans a table or walks
+a whole index (any SCAN step) or sorts in a temp B-tree, unless the function
+or sample call is listed in FULL_SCAN_ALLOWED because it reads the whole table
+by design, or in LIMITED_SCANS and the statement stops at a LIMIT.
+
+    python -m benchmarks.check_query_plans
+
+tests/test_query_plans.py runs the same check under pytest.
+"""
+import asyncio
+import inspect
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+import database as db
+
+# Sample arguments for every public function; a function missing here fails
+# the check so that new queries cannot escape it.
+CALLS = {
+    "upsert_user": (1, "alice", "Alice", "Doe"),
+    "get_user": (1,),
+    "get_user_by_username": ("alice",),
+    "all_users": (),
+    "list_payments": [
+        (1,), (1, 5), (None, 5), (),
+        (1, 5, ("2024-01-05 10:00:00", 3)), (1, 5, None, ("2024-01-05 10:00:00", 3)),
+        (None, 5, ("2024-01-05 10:00:00", 3)), (None, 5, None, ("2024-01-05 10:00:00", 3)),
+    ],
+    "list_payments_with_users": [
+        (None, 30), (None, 30, ("2024-01-05 10:00:00", 3)), (None, 30, None, ("2024-01-05 10:00:00", 3)),
+        (1, 5),
+    ],
+    "add_payment": (1, 2.5, 1, "file", "2024-01-05T10:00:00"),
+    "latest_payment": (1,),
+    "set_pending": (1, 2.5, 1),
+    "get_pending": (1,),
+    "clear_pending": (1,),
+    "set_muted_until": (1, "2030-01-01"),
+    "get_payment": (1,),
+    "export_all_payments": [(), ("2024-01-01", "2024-12-31")],
+    "delete_payment": (1,),
+    "get_coverage": (1,),
+    "all_users_with_coverage": [(), ([1, 2, 3],)],
+    "get_user_with_coverage": (1,),
+    "due_user_ids": [("2024-02-01", False), ("2024-02-01", True), ("2024-02-01", True, [None, "Europe/Berlin"])],
+    "rebuild_coverage": (),
+    "payment_stats": (),
+    "monthly_revenue": (6,),
+    "enqueue_reminders": [("2024-02-01", None, 0.0), ("2024-02-01", "2024-02-01", 0.0, ["Asia/Kolkata"])],
+    "enqueue_user_reminders": ([(1, "2024-02-01"), (2, "2024-02-01")], 0.0),
+    "claim_outbox": (100, 1.0),
+    "finish_outbox": ([1], [(2, 60.0, "timeout")], [(3, "blocked")], 1.0),
+    "recover_outbox": (1.0,),
+    "outbox_stats": (),
+    "queued_reminder_keys": (),
+    "set_timezone": (1, "Europe/Berlin"),
+    "user_timezones": (),
+    "remove_user": (1,),
+}
+
+# Functions, or (function, sample args) calls, that intentionally read every
+# row of a table.
+FULL_SCAN_ALLOWED = {
+    "all_users", "all_users_with_coverage", "rebuild_coverage",
+    "payment_stats",              # dashboard totals over every payment
+    "outbox_stats",               # counts per status over the outbox
+    "queued_reminder_keys",       # every idempotency key, for the simulation
+    "user_timezones",             # DISTINCT over idx_users_timezone
+    ("export_all_payments", ()),  # unbounded export; date-ranged exports must SEARCH
+    ("list_payments", ()),        # every payment, no page size
+}
+
+# Functions whose newest-first index walk stops at a LIMIT (keyset pages, the
+# last N months); a SCAN there is allowed only if the statement has a LIMIT
+# and needs no temp B-tree.
+LIMITED_SCANS = {"list_payments", "list_payments_with_users", "monthly_revenue"}
+
+# Lifecycle functions, not queries.
+SKIP = {"init_db", "open_pool", "close_db"}
+
+_SCAN = re.compile(r"^SCAN ")
+_LIMIT = re.compile(r"\bLIMIT\s+(\?|\d+)\s*$", re.IGNORECASE)
+_TEMP_SORT = "USE TEMP B-TREE"
+
+
+async def _explain(conn, sql: str) -> list:
+    cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+    return [row[3] for row in await cursor.fetchall()]
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "plans.db"
+        await db.init_db()
+        try:
+            return await _check()
+        finally:
+            await db.close_db()
+
+
+async def _check() -> int:
+    for uid in range(1, 51):
+        await db.upsert_user(uid, f"user{uid}", "First", "Last")
+        await db.add_payment(uid, 2.5, 1, "file", "2024-01-05T10:00:00")
+
+    current = {"fn": None, "args": None}
+    statements = []
+
+    def trace(sql: str):
+        head = sql.lstrip().split(None, 1)[0].upper()
+        if current["fn"] and head in ("SELECT", "UPDATE", "DELETE", "INSERT"):
+            statements.append((current["fn"], current["args"], sql))
+
+    for conn in [db._writer, *db._reader_conns]:
+        await conn.set_trace_callback(trace)
+
+    public = {
+        name for name, fn in inspect.getmembers(db, inspect.iscoroutinefunction)
+        if not name.startswith("_") and fn.__module__ == db.__name__ and name not in SKIP
+    }
+    missing = public - set(CALLS)
+    if missing:
+        print(f"no sample call for: {', '.join(sorted(missing))}")
+        return 1
+
+    for name, calls in CALLS.items():
+        current["fn"] = name
+        for args in calls if isinstance(calls, list) else [calls]:
+            current["args"] = args
+            result = getattr(db, name)(*args)
+            if inspect.isasyncgen(result):
+                async for _ in result:
+                    pass
+            else:
+                await result
+    current["fn"] = None
+
+    for conn in [db._writer, *db._reader_conns]:
+        await conn.set_trace_callback(None)
+
+    failures = 0
+    seen = set()
+    async with db._read() as conn:
+        for fn, args, sql in statements:
+            plan = " | ".join(await _explain(conn, sql)) or "(no table access)"
+            scans = any(_SCAN.match(step) for step in plan.split(" | "))
+            if fn in FULL_SCAN_ALLOWED or any(entry == (fn, args) for entry in FULL_SCAN_ALLOWED):
+                ok = True
+            elif _TEMP_SORT in plan:
+                ok = False
+            else:
+                ok = not scans or (fn in LIMITED_SCANS and bool(_LIMIT.search(sql.strip())))
+            if (fn, plan, ok) in seen:
+                continue
+            seen.add((fn, plan, ok))
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {fn}: {plan}")
+    print(f"{len(statements)} statements checked, {failures} regressions")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
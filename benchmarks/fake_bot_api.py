@@ -0,0 +1,105 @@
+"""
+A local stand-in for the Telegram Bot API, for load-testing reminder delivery.
+
+Answers sendMessage after a configurable latency, enforces a global
+messages-per-second limit with real 429 / retry_after responses, and replies
+403 for chats listed as blocked. Counts what it received so a benchmark can
+check that every chat got exactly one message and the limit was respected.
+
+Run it standalone and point the bot at it with BOT_API_SERVER:
+
+    python -m benchmarks.fake_bot_api [--port 8081] [--latency 0.15] [--rate 30]
+    BOT_API_SERVER=http://127.0.0.1:8081 python bot.py
+"""
+import argparse
+import asyncio
+import collections
+import time
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.15, rate: int = 30, retry_after: int = 1,
+                 blocked: Iterable[int] = ()):
+        self.latency = latency
+        self.rate = rate
+        self.retry_after = retry_after
+        self.blocked = set(blocked)
+        self.delivered = collections.Counter()  # chat_id -> messages accepted
+        self.rejected_429 = 0
+        self.peak_per_second = 0
+        self._window = collections.deque()      # accept times within the last second
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}})
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        form = await request.post()
+        chat_id = int(form["chat_id"])
+        await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1.0:
+            self._window.popleft()
+        if len(self._window) >= self.rate:
+            self.rejected_429 += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+        self._window.append(now)
+        self.peak_per_second = max(self.peak_per_second, len(self._window))
+        self.delivered[chat_id] += 1
+        self._message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": form.get("text", ""),
+        }})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def _serve(port: int, latency: float, rate: int):
+    server = FakeBotAPI(latency=latency, rate=rate)
+    print(f"fake Bot API listening on {await server.start(port=port)}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"delivered={sum(server.delivered.values())} 429s={server.rejected_429} "
+                  f"peak={server.peak_per_second}/s")
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--rate", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.port, args.latency, args.rate))
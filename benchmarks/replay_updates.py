@@ -0,0 +1,100 @@
+"""
+POST recorded Telegram updates to a running webhook (BOT_MODE=webhook) and
+report acknowledgement latency and throughput.
+
+Updates come from a file, either one Update JSON object per line or a saved
+getUpdates response ({"ok": true, "result": [...]}), or are generated: a mix
+of commands and menu button presses from --users members. Run the bot against
+the fake Bot API so replies don't go to Telegram:
+
+    python -m benchmarks.fake_bot_api --port 8081 --latency 0.05 --rate 100000
+    BOT_MODE=webhook WEBHOOK_SECRET=local BOT_API_SERVER=http://127.0.0.1:8081 python bot.py
+    python -m benchmarks.replay_updates --secret local [--file updates.jsonl | --generate 2000] [--concurrency 40]
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import List
+
+from aiohttp import ClientSession
+
+COMMANDS = ["/start", "/status", "/history", "/help"]
+BUTTONS = ["main_menu", "pay_menu", "history", "refresh_user_status", "help"]
+
+
+def load(path: Path) -> List[dict]:
+    text = path.read_text()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data["result"] if "result" in data else [data]
+
+
+def generate(count: int, users: int, seed: int = 7) -> List[dict]:
+    rng = random.Random(seed)
+    now = int(time.time())
+    updates = []
+    for i in range(1, count + 1):
+        uid = rng.randint(1000, 1000 + users - 1)
+        user = {"id": uid, "is_bot": False, "first_name": f"First{uid}", "username": f"user{uid}"}
+        chat = {"id": uid, "type": "private"}
+        if rng.random() < 0.5:
+            text = rng.choice(COMMANDS)
+            entities = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+            updates.append({"update_id": i, "message": {
+                "message_id": i, "date": now, "chat": chat, "from": user, "text": text, "entities": entities}})
+        else:
+            message = {"message_id": i, "date": now, "chat": chat, "text": "menu"}
+            updates.append({"update_id": i, "callback_query": {
+                "id": str(i), "from": user, "chat_instance": str(uid), "message": message,
+                "data": rng.choice(BUTTONS)}})
+    return updates
+
+
+async def replay(url: str, secret: str, updates: List[dict], concurrency: int):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    statuses = collections.Counter()
+    latencies = []
+    queue = collections.deque(updates)
+
+    async def worker(session: ClientSession):
+        while queue:
+            update = queue.popleft()
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f}/s), {concurrency} connections")
+    print(f"  responses: {dict(statuses)}")
+    print(f"  ack latency: p50 {statistics.median(latencies):.1f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms  max {latencies[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8080')}"
+                                         f"{os.getenv('WEBHOOK_PATH', '/telegram/webhook')}")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--file", type=Path, help="recorded updates (JSON lines or a getUpdates response)")
+    source.add_argument("--generate", type=int, default=1000, help="number of synthetic updates")
+    parser.add_argument("--users", type=int, default=200, help="distinct senders of generated updates")
+    parser.add_argument("--concurrency", type=int, default=40)
+    args = parser.parse_args()
+    updates = load(args.file) if args.file else generate(args.generate, args.users)
+    asyncio.run(replay(args.url, args.secret, updates, args.concurrency))
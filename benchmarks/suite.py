@@ -0,0 +1,179 @@
+"""
+Whole-pipeline benchmark on synthetic databases (benchmarks/synthetic.py):
+database.py queries, scheduler.users_due, the admin status/overdue reports
+and the CSV export from bot.py, and one full reminder run through the outbox.
+Writes JSON results; pass an earlier file with --compare to see what changed.
+
+Runs offline: bot.py gets a dummy token and its Bot is replaced by a stub
+that records messages instead of calling Telegram. The stub run lifts the
+reminder rate limits, so it measures our own overhead, not Telegram's pacing.
+
+    python -m benchmarks.suite [--sizes 1000 10000 100000] [--repeat 5] [--out results.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+# bot.py refuses to import without credentials; nothing here talks to Telegram.
+os.environ.setdefault("BOT_TOKEN", "123456:offline-benchmark-token")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import database as db
+import bot
+import reminders
+import scheduler
+from benchmarks.synthetic import BILLING_DAY, populate
+from coverage_service import coverage
+from utils import get_zone
+
+TZNAME = "Europe/Chisinau"
+SLOWER = 1.2  # --compare flags cases slower than this ratio
+
+
+class StubBot:
+    """Stands in for aiogram's Bot: records what would have been sent."""
+
+    def __init__(self):
+        self.messages = 0
+        self.documents = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages += 1
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.documents += 1
+
+
+async def _export():
+    file, _ = await bot.build_export()
+    file.close()
+
+
+async def _status_report(cold: bool):
+    if cold:
+        coverage.on_write("rebuild", None)  # drop the status cache
+    today = date.today()
+    bot.status_report("*Status:*", await coverage.all(), today)
+
+
+async def _overdue_report():
+    bot.overdue_report(await coverage.all(), date.today())
+
+
+async def _reminder_run():
+    # everyone due today, from scratch: the outbox would otherwise skip them
+    await db._execute_write("DELETE FROM outbox")
+    now = datetime.now(get_zone(TZNAME)).replace(hour=10, minute=0).astimezone(timezone.utc)
+    await scheduler.run_daily(bot.send_reminder_to_user, BILLING_DAY, TZNAME, 10, now)
+
+
+def cases(users: int) -> Dict[str, Callable[[], Awaitable]]:
+    uid = users // 2
+    today = date.today().isoformat()
+    tz = get_zone(TZNAME)
+    return {
+        "db.get_user": lambda: db.get_user(uid),
+        "db.get_user_with_coverage": lambda: db.get_user_with_coverage(uid),
+        "db.list_payments(user, 20)": lambda: db.list_payments(uid, 20),
+        "db.list_payments(all, 30)": lambda: db.list_payments(None, 30),
+        "db.all_users_with_coverage": lambda: db.all_users_with_coverage(),
+        "db.due_user_ids": lambda: db.due_user_ids(today, True),
+        "db.payment_stats": lambda: db.payment_stats(),
+        "db.monthly_revenue(6)": lambda: db.monthly_revenue(6),
+        "scheduler.users_due": lambda: scheduler.users_due(BILLING_DAY, tz),
+        "bot.status_report (cold cache)": lambda: _status_report(cold=True),
+        "bot.status_report (warm cache)": lambda: _status_report(cold=False),
+        "bot.overdue_report": _overdue_report,
+        "bot.build_export (csv)": _export,
+        "reminder run (stub bot)": _reminder_run,
+    }
+
+
+async def _time(fn: Callable[[], Awaitable], repeat: int) -> Dict[str, float]:
+    await fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"best_ms": round(min(samples), 3), "median_ms": round(statistics.median(samples), 3)}
+
+
+async def run_size(users: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "suite.db"
+        await db.init_db(BILLING_DAY)
+        try:
+            start = time.perf_counter()
+            payments = await populate(users)
+            print(f"\n{users} users, {payments} payments (generated in {time.perf_counter() - start:.1f}s)")
+            results = {}
+            for name, fn in cases(users).items():
+                results[name] = await _time(fn, repeat)
+                print(f"  {name:<34} best {results[name]['best_ms']:>10.2f} ms  "
+                      f"median {results[name]['median_ms']:>10.2f} ms")
+            return results
+        finally:
+            await db.close_db()
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} (median, current / baseline):")
+    for size, results in current["results"].items():
+        for name, timing in results.items():
+            old = baseline["results"].get(size, {}).get(name)
+            if not old or not old["median_ms"]:
+                continue
+            ratio = timing["median_ms"] / old["median_ms"]
+            flag = "  SLOWER" if ratio > SLOWER else ""
+            print(f"  {size:>7} {name:<34} {ratio:6.2f}x{flag}")
+
+
+async def main(sizes: List[int], repeat: int, out: Path, baseline: Path):
+    bot.bot = StubBot()
+    reminders.GLOBAL_RATE = reminders.CHAT_RATE = 1e9
+    reminders.CONCURRENCY = 64
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "repeat": repeat,
+        },
+        "results": {},
+    }
+    for users in sizes:
+        report["results"][str(users)] = await run_size(users, repeat)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {out}")
+    if baseline:
+        compare(report, json.loads(baseline.read_text()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat, args.out, args.compare))
@@ -0,0 +1,105 @@
+"""
+Synthetic subscription databases for benchmarks.
+
+Users get one of a few payment habits over the last three years: paying
+monthly (sometimes late), prepaying several months at a time, lapsing after a
+while, or never paying. Some are muted (mostly until a future date), and some
+set their own timezone. The generator is seeded, so a size always produces
+the same database.
+
+    python -m benchmarks.synthetic --users 10000 --out /tmp/synthetic.db
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import database as db
+from utils import add_months_anchor
+
+BILLING_DAY = 1
+HISTORY_DAYS = 3 * 365
+ZONES = ["America/New_York", "Europe/London", "Europe/Berlin", "Asia/Kolkata", "Asia/Tokyo"]
+# (habit, share of users)
+HABITS = [("monthly", 0.45), ("prepay", 0.25), ("lapsed", 0.2), ("never", 0.1)]
+
+
+def _habit(rng: random.Random) -> str:
+    roll, total = rng.random(), 0.0
+    for name, share in HABITS:
+        total += share
+        if roll < total:
+            return name
+    return HABITS[-1][0]
+
+
+def _payments(rng: random.Random, habit: str, joined: date, today: date) -> Iterator[Tuple[int, str]]:
+    """(months, paid_at) of one user's history."""
+    if habit == "never":
+        return
+    stop = today if habit != "lapsed" else joined + timedelta(days=rng.randint(30, max(31, (today - joined).days)))
+    anchor = add_months_anchor(joined, 0, BILLING_DAY)
+    while anchor < stop:
+        months = 1 if habit != "prepay" else rng.choice((3, 6, 12))
+        paid = anchor + timedelta(days=rng.choice((0, 0, 1, 2, 5, 12)))  # usually on time, sometimes late
+        if paid <= today:
+            yield months, f"{paid.isoformat()}T{rng.randint(8, 22):02d}:{rng.randint(0, 59):02d}:00"
+        anchor = add_months_anchor(anchor, months, BILLING_DAY)
+
+
+async def populate(users: int, seed: int = 1, today: Optional[date] = None) -> int:
+    """Fill the open (empty) database with `users` synthetic users. Returns the number of payments."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    user_rows, payment_rows = [], []
+    for uid in range(1, users + 1):
+        joined = today - timedelta(days=rng.randint(0, HISTORY_DAYS))
+        roll = rng.random()
+        if roll < 0.05:
+            muted = (today + timedelta(days=rng.randint(1, 120))).isoformat()
+        elif roll < 0.08:
+            muted = (today - timedelta(days=rng.randint(1, 300))).isoformat()
+        else:
+            muted = None
+        zone = rng.choice(ZONES) if rng.random() < 0.2 else None
+        user_rows.append((uid, f"user{uid}", f"First{uid}", f"Last{uid}", muted, zone))
+        for months, paid_at in _payments(rng, _habit(rng), joined, today):
+            payment_rows.append((uid, 2.5 * months, months, f"proof-{uid}-{len(payment_rows)}", paid_at))
+
+    async def op(conn):
+        await conn.executemany(
+            "INSERT INTO users (user_id, username, first_name, last_name, muted_until, timezone) VALUES (?, ?, ?, ?, ?, ?)",
+            user_rows
+        )
+        await conn.executemany(
+            "INSERT INTO payments (user_id, amount, months, proof_file_id, paid_at) VALUES (?, ?, ?, ?, ?)",
+            payment_rows
+        )
+    await db._submit(op)
+    await db.rebuild_coverage(BILLING_DAY)
+    return len(payment_rows)
+
+
+async def main(users: int, out: Path, seed: int):
+    if out.exists():
+        raise SystemExit(f"{out} already exists")
+    db.DB_PATH = out
+    await db.init_db(BILLING_DAY)
+    try:
+        start = time.perf_counter()
+        payments = await populate(users, seed)
+        print(f"{out}: {users} users, {payments} payments in {time.perf_counter() - start:.1f}s")
+    finally:
+        await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.out, args.seed))
@@ -1,35 +1,67 @@
 import os
 import csv
-import io
+import gzip
+import codecs
 import asyncio
-from datetime import datetime, timedelta, date
-from zoneinfo import ZoneInfo
+import tempfile
+import time
+from datetime import datetime, date, timezone
 from dateutil.relativedelta import relativedelta
 
 from aiogram import Bot, Dispatcher, F, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, FSInputFile, InputFile, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.markdown import hbold, hcode
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 import database as db
-from utils import pretty_money, parse_username_or_id, iso_to_date, next_billing_start, add_months_anchor, apply_advance_months
-from scheduler import run_daily
+from coverage_service import coverage, first_due
+from profile_cache import profiles, member_tag
+from callbacks import CallbackRouter, pack
+from utils import pretty_money, parse_username_or_id, iso_to_date, get_zone, local_today
+from simulate import simulate, report, MAX_DAYS as SIMULATE_MAX_DAYS
+from scheduler import run_daily, run_due, ReminderTimers, BUCKET_MINUTES
+from reminders import drain_outbox
+from webhook import run_webhook
+from update_scheduler import update_scheduler
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" (getUpdates) or "webhook" (see webhook.py)
 MONTHLY_AMOUNT = float(os.getenv("MONTHLY_AMOUNT", "2.50"))
 BILLING_DAY = int(os.getenv("BILLING_DAY", "1"))            # 1..28 recommended
 TZNAME = os.getenv("TIMEZONE", "Europe/Chisinau")
 REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "10"))
+OUTBOX_RETRY_MINUTES = int(os.getenv("OUTBOX_RETRY_MINUTES", "5"))  # how often failed reminders are retried
+REMINDER_MODE = os.getenv("REMINDER_MODE", "daily")  # "daily" cron scan or per-user "event" timers
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(1024 * 1024)))  # kept in memory before spilling to disk
+EXPORT_HEADER = ["id","user_id","username","first_name","last_name","amount","months","proof_file_id","paid_at"]
+HISTORY_PAGE_SIZE = 20
+ADMIN_HISTORY_PAGE_SIZE = 30
+MANAGE_PAGE_SIZE = 10
 
 if not BOT_TOKEN or not ADMIN_ID:
     raise RuntimeError("BOT_TOKEN and ADMIN_ID must be set via environment variables.")
 
-bot = Bot(token=BOT_TOKEN)
+# Point the bot at another Bot API server (self-hosted, or a local fake for load tests).
+BOT_API_SERVER = os.getenv("BOT_API_SERVER")
+if BOT_API_SERVER:
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_SERVER)))
+else:
+    bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
+dp.update.outer_middleware(update_scheduler)  # parallel across users, in order per user
+callbacks = CallbackRouter()
+# buttons sent before the versioned encoding: pay_<amount>_<months>, delete_payment_<id>, confirm_delete_<id>
+callbacks.legacy("pay_", "pay")
+callbacks.legacy("delete_payment_", "delete_payment")
+callbacks.legacy("confirm_delete_", "confirm_delete")
 scheduler = AsyncIOScheduler()
+reminder_timers = None  # ReminderTimers in REMINDER_MODE=event
 
 # ---------- Helpers ----------
 def is_admin(user_id:int) -> bool:
@@ -39,10 +71,153 @@ def user_label(u: types.User) -> str:
     tag = f"@{u.username}" if u.username else str(u.id)
     return f"{u.full_name} ({tag})"
 
+def user_today(user) -> date:
+    """Today in the user's own timezone (the bot's TIMEZONE if they haven't set one)."""
+    return local_today(user["timezone"] if user and user["timezone"] else TZNAME)
+
 async def ensure_member(msg: Message):
-    u = msg.from_user
-    await db.upsert_user(u.id, u.username or "", u.first_name or "", u.last_name or "")
-    return await db.get_user(u.id)
+    """Store the sender's profile if it changed (see profile_cache.py) and return their row."""
+    return await profiles.ensure(msg.from_user)
+
+def status_line(s, today: date) -> str:
+    """One line of the admin status list for a CoverageStatus."""
+    if s.next_due:
+        status = f"covered through {s.covered_through.isoformat()}, next due {s.next_due.isoformat()}"
+    else:
+        status = f"no payments yet, next due {s.due_date(today, BILLING_DAY).isoformat()}"
+    mute = f", muted until {s.muted_until.isoformat()}" if s.muted_until else ""
+    uname = f"@{s.username}" if s.username else str(s.user_id)
+    return f"• {uname}: {status}{mute}"
+
+def status_report(title: str, statuses, today: date) -> str:
+    """Admin status list: the title, then one status_line per CoverageStatus."""
+    return "\n".join([title, *(status_line(s, today) for s in statuses)])
+
+def overdue_report(statuses, today: date) -> str:
+    """Admin list of users whose coverage has ended or who never paid."""
+    if not statuses:
+        return "⚠️ *Overdue Users* ⚠️\n\nNo users registered yet."
+    lines = []
+    for st in statuses:
+        username = f"@{st.username}" if st.username else f"ID:{st.user_id}"
+        if not st.covered_through:
+            lines.append(f"• {username}: No payments recorded")
+        elif st.covered_through < today:  # Coverage ended
+            lines.append(f"• {username}: {(today - st.covered_through).days} days overdue")
+    if not lines:
+        return "✅ *Overdue Users* ✅\n\nAll users are up to date!"
+    return "\n".join(["⚠️ *Overdue Users* ⚠️\n", *lines])
+
+class SpooledInputFile(InputFile):
+    """Upload an open binary file in chunks instead of reading it into memory."""
+    def __init__(self, file, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot):
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+async def build_export(compress: bool = False, since: str = None, until: str = None):
+    """
+    Stream payments into a CSV spooled temporary file (optionally gzip-compressed).
+    Returns (file, row_count); the caller closes the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    raw = gzip.GzipFile(fileobj=spool, mode="wb") if compress else spool
+    writer = csv.writer(codecs.getwriter("utf-8")(raw))
+    writer.writerow(EXPORT_HEADER)
+    count = 0
+    async for chunk in db.export_all_payments(since, until):
+        writer.writerows(chunk)
+        count += len(chunk)
+    if compress:
+        raw.close()  # writes the gzip trailer; leaves the spool open
+    spool.seek(0)
+    return spool, count
+
+def parse_export_args(args: str) -> tuple:
+    """
+    Parse `/export [gzip] [from YYYY-MM-DD] [to YYYY-MM-DD]` arguments. Bare
+    dates also work: the first is the start, the second the end. Raises
+    ValueError on bad input or a start after the end.
+    """
+    compress, since, until = False, None, None
+    tokens = iter((args or "").split())
+    for token in tokens:
+        word = token.lower()
+        if word in ("gz", "gzip"):
+            compress = True
+            continue
+        if word in ("from", "to"):
+            value = next(tokens, None)
+            if value is None:
+                raise ValueError(f"missing date after {word}")
+        else:
+            value, word = token, "from" if since is None and until is None else "to"
+        day = date.fromisoformat(value).isoformat()
+        if word == "from":
+            if since is not None:
+                raise ValueError("start date given twice")
+            since = day
+        else:
+            if until is not None:
+                raise ValueError("end date given twice")
+            until = day
+    if since and until and since > until:
+        raise ValueError("start date after end date")
+    return compress, since, until
+
+def export_filename(compress: bool, since: str = None, until: str = None) -> str:
+    name = "payments"
+    if since:
+        name += f"_{since}"
+    if until:
+        name += f"_to_{until}"
+    return name + (".csv.gz" if compress else ".csv")
+
+def encode_page(action: str, direction: str, payment) -> str:
+    """Callback data for a history page button: direction (n|p) and the keyset cursor."""
+    created = datetime.fromisoformat(payment["created_at"]).replace(tzinfo=timezone.utc)
+    return pack(action, direction, int(created.timestamp()), payment["id"])
+
+def decode_page(direction: str = None, epoch: int = None, payment_id: int = None) -> tuple:
+    """Inverse of encode_page, from the parsed callback args: (direction, (created_at, id)), or (None, None) for the first page."""
+    if direction is None:
+        return None, None
+    created = datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return direction, (created, payment_id)
+
+async def load_payment_page(action: str, page: tuple, size: int, user_id: int = None,
+                            with_users: bool = False) -> tuple:
+    """
+    Fetch the history page addressed by the callback args `page` (keyset, so
+    every page costs the same). with_users joins in the payers' usernames.
+    Returns (payments, nav buttons row).
+    """
+    fetch = db.list_payments_with_users if with_users else db.list_payments
+    direction, cursor = decode_page(*page)
+    if direction == "p":
+        payments = await fetch(user_id, size + 1, after=cursor)
+        has_newer, has_older = len(payments) > size, True
+        payments = payments[-size:]
+    else:
+        payments = await fetch(user_id, size + 1, before=cursor)
+        has_newer, has_older = cursor is not None, len(payments) > size
+        payments = payments[:size]
+    if not payments and cursor:
+        # The page was emptied by deletes; start over from the newest.
+        return await load_payment_page(action, (), size, user_id, with_users)
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️ Newer", callback_data=encode_page(action, "p", payments[0])))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="Older ➡️", callback_data=encode_page(action, "n", payments[-1])))
+    return payments, nav
 
 def create_main_menu() -> InlineKeyboardMarkup:
     """Create main menu keyboard for regular users"""
@@ -95,9 +270,9 @@ def create_admin_menu() -> InlineKeyboardMarkup:
 def create_payment_menu() -> InlineKeyboardMarkup:
     """Create quick payment options"""
     buttons = [
-        [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT)} (1 month)", callback_data=f"pay_{MONTHLY_AMOUNT}_1")],
-        [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT * 3)} (3 months)", callback_data=f"pay_{MONTHLY_AMOUNT * 3}_3"),
-         InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT * 6)} (6 months)", callback_data=f"pay_{MONTHLY_AMOUNT * 6}_6")],
+        [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT)} (1 month)", callback_data=pack("pay", MONTHLY_AMOUNT, 1))],
+        [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT * 3)} (3 months)", callback_data=pack("pay", MONTHLY_AMOUNT * 3, 3)),
+         InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT * 6)} (6 months)", callback_data=pack("pay", MONTHLY_AMOUNT * 6, 6))],
         [InlineKeyboardButton(text="💳 Custom Amount", callback_data="pay_custom")],
         [InlineKeyboardButton(text="🏠 Main Menu", callback_data="main_menu"),
          InlineKeyboardButton(text="❌ Cancel", callback_data="main_menu")]
@@ -150,9 +325,10 @@ def create_admin_quick_actions_menu() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def create_history_menu(is_admin: bool = False) -> InlineKeyboardMarkup:
+def create_history_menu(is_admin: bool = False, nav: list = None) -> InlineKeyboardMarkup:
     """Create history menu with additional options"""
-    buttons = [
+    buttons = [nav] if nav else []
+    buttons += [
         [InlineKeyboardButton(text="💳 Make Payment", callback_data="pay_menu")],
         [InlineKeyboardButton(text="🔄 Refresh History", callback_data="history")]
     ]
@@ -221,10 +397,10 @@ async def cmd_start(msg: Message):
     await msg.answer(text, parse_mode="Markdown", reply_markup=reply_keyboard)
     await msg.answer("Choose from the options above or use the quick buttons below:", reply_markup=inline_keyboard)
 
-@dp.message(Command("help"))
-async def cmd_help(msg: Message):
+def help_text(admin: bool, tips: str) -> str:
+    """Command list shared by /help and the Help button; `tips` is the closing tips section."""
     admin_commands = ""
-    if is_admin(msg.from_user.id):
+    if admin:
         admin_commands = (
             "\n*🔧 Admin Commands:*\n"
             "• /status — 📊 View who's paid & next due dates\n"
@@ -234,23 +410,30 @@ async def cmd_help(msg: Message):
             "• /proof <@user|id> — 🔍 Fetch latest proof\n"
             "• /addmember <@user|id> — 👤 Add/track a member\n"
             "• /remove <@user|id> — 🗑️ Remove member & data\n"
-            "• /export — 📥 CSV export of all payments\n"
+            "• /export [gzip] [from YYYY-MM-DD] [to YYYY-MM-DD] — 📥 CSV export of payments\n"
+            "• /rebuildcoverage — 🔁 Recompute coverage from payments\n"
+            "• /simulate [days] — 🔮 Dry run: who gets reminded when\n"
         )
-    
-    text = (
+    return (
         "❓ *Help & Available Commands* ❓\n\n"
         "*📱 User Commands:*\n"
         "• /start — 🏠 Register & show main menu\n"
         "• /pay <amount> <months> — 💳 Begin payment process\n"
         "• /history — 📊 View your last 20 payments\n"
+        "• /timezone [Area/City] — 🌍 Show or set your timezone for reminders\n"
         "• /help — ❓ Show this help message\n"
         + admin_commands +
         "\n💡 *Tips:*\n"
+        + tips
+    )
+
+@dp.message(Command("help"))
+async def cmd_help(msg: Message):
+    text = help_text(is_admin(msg.from_user.id), (
         "• Use the buttons below for quick actions\n"
         "• After /pay, upload your payment proof immediately\n"
         "• Contact admin if you have any issues\n"
-    )
-    
+    ))
     await msg.answer(text, parse_mode="Markdown", reply_markup=create_help_menu())
 
 @dp.message(Command("pay"))
@@ -339,10 +522,34 @@ async def handle_proof(msg: Message):
     except:
         pass
 
+@dp.message(Command("timezone"))
+async def cmd_timezone(msg: Message, command: CommandObject):
+    user = await ensure_member(msg)
+    if not command.args:
+        current = user["timezone"] or f"{TZNAME} (default)"
+        return await msg.answer(
+            f"🌍 Your timezone: *{current}*\n\n"
+            f"Reminders arrive at {REMINDER_HOUR}:00 your local time.\n"
+            "Change it with `/timezone Area/City` (e.g. `/timezone Europe/Berlin`), "
+            "or `/timezone default` to use the bot's timezone.",
+            parse_mode="Markdown"
+        )
+    name = command.args.strip()
+    if name.lower() == "default":
+        await db.set_timezone(msg.from_user.id, None)
+        return await msg.answer(f"🌍 Timezone reset to {TZNAME}.")
+    try:
+        get_zone(name)
+    except (KeyError, ValueError):
+        return await msg.reply("Unknown timezone. Use an IANA name like `Europe/Berlin` or `America/New_York`.",
+                               parse_mode="Markdown")
+    await db.set_timezone(msg.from_user.id, name)
+    await msg.answer(f"🌍 Timezone set to {name}. Reminders will arrive at {REMINDER_HOUR}:00 local time.")
+
 @dp.message(Command("history"))
 async def cmd_history(msg: Message):
     await ensure_member(msg)
-    payments = await db.list_payments(msg.from_user.id, limit=20)
+    payments, nav = await load_payment_page("hist", (), HISTORY_PAGE_SIZE, msg.from_user.id)
     if not payments:
         text = (
             "📊 *Payment History* 📊\n\n"
@@ -366,12 +573,12 @@ async def cmd_history(msg: Message):
         total_months += p['months']
     
     # Add summary
-    lines.append(f"\n📈 *Summary:*")
+    lines.append(f"\n📈 *Summary (this page):*")
     lines.append(f"Total paid: *{pretty_money(total_amount)}*")
     lines.append(f"Total months: *{total_months}*")
     
     text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+    keyboard = InlineKeyboardMarkup(inline_keyboard=([nav] if nav else []) + [
         [InlineKeyboardButton(text="💳 Make Payment", callback_data="pay_menu")],
         [InlineKeyboardButton(text="🏠 Main Menu", callback_data="main_menu")]
     ])
@@ -405,34 +612,13 @@ async def handle_menu_button(msg: Message):
 @dp.message(F.text == "🔄 Status")
 async def handle_status_button(msg: Message):
     """Handle Status button from reply keyboard - unified for all users"""
-    await ensure_member(msg)
+    user = await ensure_member(msg)
     user_id = msg.from_user.id
-    user = await db.get_user(user_id)
     
     if is_admin(user_id):
         # Show admin view of all users status
-        today = date.today()
-        users = await db.all_users()
-        
-        lines = [f"📊 *All Users Status* - {today.isoformat()}"]
-        
-        for u in users:
-            payments = await db.list_payments(u["user_id"])
-            if payments:
-                p = payments[-1]  # most recent
-                from utils import compute_coverage_until
-                last_cov = compute_coverage_until(iso_to_date(p["paid_at"]), int(p["months"]), BILLING_DAY)
-                due = next_billing_start(last_cov, BILLING_DAY)
-                status = f"covered through {last_cov.isoformat()}, next due {due.isoformat()}"
-            else:
-                anchor = date(today.year, today.month, 1).replace(day=min(BILLING_DAY, 28))
-                status = f"no payments yet, next due {anchor.isoformat()}"
-
-            mute = f", muted until {u['muted_until']}" if u["muted_until"] else ""
-            uname = f"@{u['username']}" if u["username"] else str(u["user_id"])
-            lines.append(f"• {uname}: {status}{mute}")
-        
-        text = "\n".join(lines)
+        today = local_today(TZNAME)
+        text = status_report(f"📊 *All Users Status* - {today.isoformat()}", await coverage.all(), today)
         
         # Enhanced admin status buttons
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -443,18 +629,12 @@ async def handle_status_button(msg: Message):
         ])
     else:
         # Show regular user their personal status
-        payments = await db.list_payments(user_id)
+        status = await coverage.get(user_id)
         
-        from utils import compute_coverage_until
-        from datetime import date
+        today = user_today(user)
         
-        today = date.today()
-        
-        if payments:
-            latest_payment = payments[-1]
-            last_coverage = compute_coverage_until(iso_to_date(latest_payment["paid_at"]), 
-                                                  int(latest_payment["months"]), BILLING_DAY)
-            due_date = next_billing_start(last_coverage, BILLING_DAY)
+        if status and status.next_due:
+            last_coverage, due_date = status.covered_through, status.next_due
             days_until_due = (due_date - today).days
             
             if days_until_due > 0:
@@ -468,7 +648,7 @@ async def handle_status_button(msg: Message):
         else:
             status_emoji = "❌"
             status_text = "No payments recorded"
-            due_text = f"Next payment due: {date(today.year, today.month, BILLING_DAY).strftime('%Y-%m-%d')}"
+            due_text = f"Next payment due: {first_due(today, BILLING_DAY).strftime('%Y-%m-%d')}"
         
         text = (
             f"🔄 *Your Status* 🔄\n\n"
@@ -512,7 +692,12 @@ async def handle_cancel_button(msg: Message):
 # Admin reply keyboard handlers removed - now handled by consolidated MENU system
 
 # ---------- Callback Handlers ----------
-@dp.callback_query(F.data == "main_menu")
+@dp.callback_query()
+async def on_callback(callback: CallbackQuery):
+    # the one aiogram callback handler; actions are looked up in `callbacks`
+    await callbacks.dispatch(callback)
+
+@callbacks.action("main_menu")
 async def callback_main_menu(callback: CallbackQuery):
     user_id = callback.from_user.id
     if is_admin(user_id):
@@ -537,7 +722,7 @@ async def callback_main_menu(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "pay_menu")
+@callbacks.action("pay_menu")
 async def callback_pay_menu(callback: CallbackQuery):
     text = (
         "💳 *Payment Options* 💳\n\n"
@@ -548,60 +733,44 @@ async def callback_pay_menu(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_payment_menu())
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("pay_"))
-async def callback_pay_amount(callback: CallbackQuery):
+@callbacks.action("pay_custom")
+async def callback_pay_custom(callback: CallbackQuery):
+    text = (
+        "💳 *Custom Payment* 💳\n\n"
+        "Please use the command format:\n"
+        "`/pay <amount> <months>`\n\n"
+        "Examples:\n"
+        f"• `/pay {pretty_money(MONTHLY_AMOUNT)} 1` - one month\n"
+        f"• `/pay {pretty_money(MONTHLY_AMOUNT * 2)} 2` - two months\n"
+        "• `/pay 10.50 4` - custom amount for 4 months"
+    )
+    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_payment_menu())
+    await callback.answer()
+
+@callbacks.action("pay", float, int)
+async def callback_pay_amount(callback: CallbackQuery, amount: float, months: int):
     try:
-        data = callback.data
-        if data == "pay_custom":
-            text = (
-                "💳 *Custom Payment* 💳\n\n"
-                "Please use the command format:\n"
-                "`/pay <amount> <months>`\n\n"
-                "Examples:\n"
-                f"• `/pay {pretty_money(MONTHLY_AMOUNT)} 1` - one month\n"
-                f"• `/pay {pretty_money(MONTHLY_AMOUNT * 2)} 2` - two months\n"
-                "• `/pay 10.50 4` - custom amount for 4 months"
-            )
-            await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_payment_menu())
-        else:
-            # Extract amount and months from callback data like "pay_2.50_1"
-            parts = data.split("_")
-            if len(parts) == 3:
-                try:
-                    amount = float(parts[1])
-                    months = int(parts[2])
-                    user_id = callback.from_user.id
-                    
-                    if amount <= 0 or months <= 0:
-                        await callback.answer("Invalid amount or months", show_alert=True)
-                        return
-                    
-                    # Set pending payment
-                    await db.set_pending(user_id, amount, months)
-                    
-                    text = (
-                        "✅ *Payment Started* ✅\n\n"
-                        f"Amount: *{pretty_money(amount)}*\n"
-                        f"Months: *{months}*\n\n"
-                        "📎 Now please upload your payment proof (photo or document) in your next message."
-                    )
-                    
-                    # Add helpful buttons for payment confirmation
-                    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="❌ Cancel Payment", callback_data="cancel_payment")],
-                        [InlineKeyboardButton(text="🏠 Main Menu", callback_data="main_menu")]
-                    ])
-                    
-                    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
-                except ValueError:
-                    await callback.answer("Invalid payment data format", show_alert=True)
-                    await callback.message.edit_text("❌ Error processing payment", 
-                                                    parse_mode="Markdown", reply_markup=create_payment_menu())
-            else:
-                await callback.answer("Invalid callback data", show_alert=True)
-                await callback.message.edit_text("❌ Error processing request", 
-                                                parse_mode="Markdown", reply_markup=create_payment_menu())
-        
+        if amount <= 0 or months <= 0:
+            await callback.answer("Invalid amount or months", show_alert=True)
+            return
+
+        # Set pending payment
+        await db.set_pending(callback.from_user.id, amount, months)
+
+        text = (
+            "✅ *Payment Started* ✅\n\n"
+            f"Amount: *{pretty_money(amount)}*\n"
+            f"Months: *{months}*\n\n"
+            "📎 Now please upload your payment proof (photo or document) in your next message."
+        )
+
+        # Add helpful buttons for payment confirmation
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="❌ Cancel Payment", callback_data="cancel_payment")],
+            [InlineKeyboardButton(text="🏠 Main Menu", callback_data="main_menu")]
+        ])
+
+        await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
         await callback.answer()
     except Exception as e:
         await callback.answer(f"Error: {str(e)}", show_alert=True)
@@ -609,12 +778,13 @@ async def callback_pay_amount(callback: CallbackQuery):
         await callback.message.edit_text("❌ An error occurred. Please try again.", 
                                        parse_mode="Markdown", reply_markup=create_payment_menu())
 
-@dp.callback_query(F.data == "history")
-async def callback_history(callback: CallbackQuery):
+@callbacks.action("history")
+@callbacks.action("hist", str, int, int, fallback=True)
+async def callback_history(callback: CallbackQuery, *page):
     try:
         user_id = callback.from_user.id
         is_admin_user = is_admin(user_id)
-        payments = await db.list_payments(user_id, limit=20)
+        payments, nav = await load_payment_page("hist", page, HISTORY_PAGE_SIZE, user_id)
         
         if not payments:
             text = (
@@ -637,11 +807,11 @@ async def callback_history(callback: CallbackQuery):
                 except Exception as e:
                     lines.append(f"• Invalid payment record: {p.get('id', 'unknown')}")
             
-            lines.append(f"\n📋 *Summary:*")
+            lines.append(f"\n📋 *Summary (this page):*")
             lines.append(f"Total paid: *{pretty_money(total_amount)}*")
             lines.append(f"Total months: *{total_months}*")
             text = "\n".join(lines)
-            keyboard = create_history_menu(is_admin_user)
+            keyboard = create_history_menu(is_admin_user, nav)
         
         await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
         await callback.answer()
@@ -656,38 +826,16 @@ async def callback_history(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error loading payment history. Please try again.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "help")
+@callbacks.action("help")
 async def callback_help(callback: CallbackQuery):
     try:
-        admin_commands = ""
-        if is_admin(callback.from_user.id):
-            admin_commands = (
-                "\n*🔧 Admin Commands:*\n"
-                "• /status — 📊 View who's paid & next due dates\n"
-                "• /setmute <@user|id> <months> — 🔇 Mute reminders\n"
-                "• /setamount <value> — 💰 Set monthly amount\n"
-                "• /setday <1-28> — 📅 Set billing day\n"
-                "• /proof <@user|id> — 🔍 Fetch latest proof\n"
-                "• /addmember <@user|id> — 👤 Add/track a member\n"
-                "• /remove <@user|id> — 🗑️ Remove member & data\n"
-                "• /export — 📥 CSV export of all payments\n"
-            )
-        
-        text = (
-            "❓ *Help & Available Commands* ❓\n\n"
-            "*📱 User Commands:*\n"
-            "• /start — 🏠 Register & show main menu\n"
-            "• /pay <amount> <months> — 💳 Begin payment process\n"
-            "• /history — 📊 View your last 20 payments\n"
-            "• /help — ❓ Show this help message\n"
-            + admin_commands +
-            "\n💡 *Tips:*\n"
+        text = help_text(is_admin(callback.from_user.id), (
             "• Use the buttons below for quick actions\n"
             "• After /pay, upload your payment proof immediately\n"
             "• Use the 📋 MENU button for quick access to all functions\n"
             "• Use the 🔄 Status button to check payment status\n"
             "• Contact admin if you have any issues\n"
-        )
+        ))
         
         # Create enhanced help menu with more options
         if is_admin(callback.from_user.id):
@@ -714,7 +862,7 @@ async def callback_help(callback: CallbackQuery):
                                        parse_mode="Markdown", reply_markup=keyboard)
 
 # Admin callback handlers
-@dp.callback_query(F.data == "admin_menu")
+@callbacks.action("admin_menu")
 async def callback_admin_menu(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -727,46 +875,18 @@ async def callback_admin_menu(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_admin_menu())
     await callback.answer()
 
-@dp.callback_query(F.data == "status")
+@callbacks.action("status")
 async def callback_status(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
     try:
-        users = await db.all_users()
-        if not users:
+        statuses = await coverage.all()
+        if not statuses:
             text = "📊 *User Status* 📊\n\nNo users registered yet."
         else:
-            # Build status similar to cmd_status
-            tz = ZoneInfo(TZNAME)
-            today = datetime.now(tz).date()
-            lines = ["📊 *User Status* 📊\n"]
-            
-            for u in users:
-                try:
-                    payments = await db.list_payments(u["user_id"], limit=1000)
-                    if payments:
-                        payments_sorted = sorted(payments, key=lambda p: p["paid_at"])
-                        from utils import compute_coverage_until
-                        last_cov = iso_to_date(payments_sorted[0]["paid_at"])
-                        last_cov = last_cov.replace(day=1)
-                        for p in payments_sorted:
-                            last_cov = compute_coverage_until(iso_to_date(p["paid_at"]), int(p["months"]), BILLING_DAY)
-                        due = next_billing_start(last_cov, BILLING_DAY)
-                        status = f"covered through {last_cov.isoformat()}, next due {due.isoformat()}"
-                    else:
-                        anchor = date(today.year, today.month, 1).replace(day=min(BILLING_DAY, 28))
-                        status = f"no payments yet, next due {anchor.isoformat()}"
-
-                    mute = f", muted until {u['muted_until']}" if u["muted_until"] else ""
-                    uname = f"@{u['username']}" if u["username"] else str(u["user_id"])
-                    lines.append(f"• {uname}: {status}{mute}")
-                except Exception as e:
-                    uname = f"@{u['username']}" if u["username"] else str(u["user_id"])
-                    lines.append(f"• {uname}: Error loading data")
-            
-            text = "\n".join(lines)
+            text = status_report("📊 *User Status* 📊\n", statuses, local_today(TZNAME))
         
         # Enhanced admin status buttons
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -782,7 +902,7 @@ async def callback_status(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error loading user status. Please try again.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "admin_settings")
+@callbacks.action("admin_settings")
 async def callback_admin_settings(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -797,7 +917,7 @@ async def callback_admin_settings(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_admin_settings_menu())
     await callback.answer()
 
-@dp.callback_query(F.data == "user_management")
+@callbacks.action("user_management")
 async def callback_user_management(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -810,7 +930,12 @@ async def callback_user_management(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_user_management_menu())
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("set_") or F.data.startswith("add_") or F.data.startswith("mute_") or F.data.startswith("remove_") or F.data.startswith("get_"))
+@callbacks.action("set_amount")
+@callbacks.action("set_day")
+@callbacks.action("add_member")
+@callbacks.action("mute_user")
+@callbacks.action("remove_user")
+@callbacks.action("get_proof")
 async def callback_admin_actions(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -895,31 +1020,27 @@ async def callback_admin_actions(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "export")
+@callbacks.action("export")
 async def callback_export(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
-    rows = await db.export_all_payments()
-    if not rows:
-        text = "📥 *Export Data* 📥\n\nNo payments to export."
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Back to Admin", callback_data="admin_menu")]])
-        await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
-    else:
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["id","user_id","username","first_name","last_name","amount","months","proof_file_id","paid_at"])
-        writer.writerows(rows)
-        output.seek(0)
-        data = io.BytesIO(output.getvalue().encode("utf-8"))
-        data.name = "payments.csv"
-        await bot.send_document(chat_id=callback.message.chat.id, document=data, caption="📥 All payments export")
+    data, count = await build_export()
+    with data:
+        if not count:
+            text = "📥 *Export Data* 📥\n\nNo payments to export."
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Back to Admin", callback_data="admin_menu")]])
+            await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+        else:
+            await bot.send_document(chat_id=callback.message.chat.id,
+                                    document=SpooledInputFile(data, export_filename(False)),
+                                    caption="📥 All payments export")
     
     await callback.answer()
 
 # ---------- New Enhanced Callbacks ----------
-@dp.callback_query(F.data == "admin_quick_actions")
+@callbacks.action("admin_quick_actions")
 async def callback_admin_quick_actions(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -932,14 +1053,15 @@ async def callback_admin_quick_actions(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=create_admin_quick_actions_menu())
     await callback.answer()
 
-@dp.callback_query(F.data == "admin_history")
-async def callback_admin_history(callback: CallbackQuery):
+@callbacks.action("admin_history")
+@callbacks.action("ahist", str, int, int, fallback=True)
+async def callback_admin_history(callback: CallbackQuery, *page):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
     try:
-        payments = await db.list_payments(limit=30)  # Get last 30 payments for admin
+        payments, nav = await load_payment_page("ahist", page, ADMIN_HISTORY_PAGE_SIZE, with_users=True)
         if not payments:
             text = "💾 *All Payment History* 💾\n\nNo payments in database."
             keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Back to Admin", callback_data="admin_menu")]])
@@ -950,18 +1072,17 @@ async def callback_admin_history(callback: CallbackQuery):
             for p in payments:
                 try:
                     t = iso_to_date(p["paid_at"])
-                    user_info = await db.get_user(p["user_id"])
-                    username = f"@{user_info['username']}" if user_info and user_info['username'] else f"ID:{p['user_id']}"
+                    username = member_tag(p["user_id"], p["username"])
                     lines.append(f"• {t.isoformat()}: {username} - {pretty_money(p['amount'])} ({p['months']}mo)")
                     total_amount += p['amount']
                 except Exception as e:
                     lines.append(f"• Invalid payment record: {p.get('id', 'unknown')}")
             
             lines.append(f"\n💰 *Total shown: {pretty_money(total_amount)}*")
-            lines.append(f"📊 *Showing last {len(payments)} payments*")
+            lines.append(f"📊 *Showing {len(payments)} payments*")
             text = "\n".join(lines)
             
-            buttons = [
+            buttons = ([nav] if nav else []) + [
                 [InlineKeyboardButton(text="🗑️ Manage Payments", callback_data="manage_payments")],
                 [InlineKeyboardButton(text="🔙 Back to Admin", callback_data="admin_menu")]
             ]
@@ -975,14 +1096,15 @@ async def callback_admin_history(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error loading payment history. Please try again.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "manage_payments")
-async def callback_manage_payments(callback: CallbackQuery):
+@callbacks.action("manage_payments")
+@callbacks.action("mpay", str, int, int, fallback=True)
+async def callback_manage_payments(callback: CallbackQuery, *page):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
     try:
-        payments = await db.list_payments(limit=10)  # Show last 10 for management
+        payments, nav = await load_payment_page("mpay", page, MANAGE_PAGE_SIZE, with_users=True)
         if not payments:
             text = "🗑️ *Manage Payments* 🗑️\n\nNo payments to manage."
             keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Back", callback_data="admin_history")]])
@@ -993,14 +1115,15 @@ async def callback_manage_payments(callback: CallbackQuery):
             for p in payments:
                 try:
                     t = iso_to_date(p["paid_at"])
-                    user_info = await db.get_user(p["user_id"])
-                    username = f"@{user_info['username']}" if user_info and user_info['username'] else f"ID:{p['user_id']}"
+                    username = member_tag(p["user_id"], p["username"])
                     button_text = f"❌ {t.strftime('%m/%d')} {username} {pretty_money(p['amount'])}"
-                    buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"delete_payment_{p['id']}")])
+                    buttons.append([InlineKeyboardButton(text=button_text, callback_data=pack("delete_payment", p["id"]))])
                 except Exception as e:
                     # Skip invalid payments
                     continue
             
+            if nav:
+                buttons.append(nav)
             buttons.append([InlineKeyboardButton(text="🔙 Back", callback_data="admin_history")])
             text = "\n".join(lines)
             keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -1013,27 +1136,20 @@ async def callback_manage_payments(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error loading payment management. Please try again.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data.startswith("delete_payment_"))
-async def callback_delete_payment(callback: CallbackQuery):
+@callbacks.action("delete_payment", int)
+async def callback_delete_payment(callback: CallbackQuery, payment_id: int):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
     try:
-        payment_id_str = callback.data.split("_", 2)[2]
-        if not payment_id_str.isdigit():
-            await callback.answer("Invalid payment ID", show_alert=True)
-            return
-            
-        payment_id = int(payment_id_str)
         payment = await db.get_payment(payment_id)
         
         if not payment:
             await callback.answer("Payment not found", show_alert=True)
             return
         
-        user_info = await db.get_user(payment["user_id"])
-        username = f"@{user_info['username']}" if user_info and user_info['username'] else f"ID:{payment['user_id']}"
+        username = await profiles.label(payment["user_id"])
         t = iso_to_date(payment["paid_at"])
         
         text = (
@@ -1047,7 +1163,7 @@ async def callback_delete_payment(callback: CallbackQuery):
         )
         
         buttons = [
-            [InlineKeyboardButton(text="✅ Yes, Delete", callback_data=f"confirm_delete_{payment_id}"),
+            [InlineKeyboardButton(text="✅ Yes, Delete", callback_data=pack("confirm_delete", payment_id)),
              InlineKeyboardButton(text="❌ Cancel", callback_data="manage_payments")]
         ]
         keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -1060,19 +1176,13 @@ async def callback_delete_payment(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error processing deletion request.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data.startswith("confirm_delete_"))
-async def callback_confirm_delete_payment(callback: CallbackQuery):
+@callbacks.action("confirm_delete", int)
+async def callback_confirm_delete_payment(callback: CallbackQuery, payment_id: int):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
     try:
-        payment_id_str = callback.data.split("_", 2)[2]
-        if not payment_id_str.isdigit():
-            await callback.answer("Invalid payment ID", show_alert=True)
-            return
-            
-        payment_id = int(payment_id_str)
         success = await db.delete_payment(payment_id)
         
         if success:
@@ -1090,15 +1200,12 @@ async def callback_confirm_delete_payment(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error occurred during deletion.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "refresh_user_status")
+@callbacks.action("refresh_user_status")
 async def callback_refresh_user_status(callback: CallbackQuery):
     user_id = callback.from_user.id
     try:
         # Ensure user is in database
-        await db.upsert_user(callback.from_user.id, 
-                            callback.from_user.username or "", 
-                            callback.from_user.first_name or "", 
-                            callback.from_user.last_name or "")
+        await profiles.ensure(callback.from_user)
         
         # Show user's current status
         payments = await db.list_payments(user_id, limit=5)
@@ -1110,13 +1217,10 @@ async def callback_refresh_user_status(callback: CallbackQuery):
             text_lines.append(f"💳 Last payment: {pretty_money(latest_payment['amount'])} on {t.isoformat()}")
             text_lines.append(f"📝 For {latest_payment['months']} months")
             
-            # Calculate coverage status
-            from utils import compute_coverage_until, next_billing_start
-            from datetime import date
-            
-            today = date.today()
-            last_coverage = compute_coverage_until(t, int(latest_payment["months"]), BILLING_DAY)
-            due_date = next_billing_start(last_coverage, BILLING_DAY)
+            # Coverage status
+            status = await coverage.get(user_id)
+            today = local_today(status.timezone or TZNAME)
+            last_coverage, due_date = status.covered_through, status.next_due
             days_until_due = (due_date - today).days
             
             if days_until_due > 0:
@@ -1163,7 +1267,7 @@ async def callback_refresh_user_status(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error refreshing status. Please try again.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "list_users")
+@callbacks.action("list_users")
 async def callback_list_users(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -1188,7 +1292,7 @@ async def callback_list_users(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "cancel_payment")
+@callbacks.action("cancel_payment")
 async def callback_cancel_payment(callback: CallbackQuery):
     try:
         user_id = callback.from_user.id
@@ -1220,21 +1324,20 @@ async def callback_cancel_payment(callback: CallbackQuery):
         await callback.message.edit_text("❌ Error occurred. Returned to main menu.", 
                                        parse_mode="Markdown", reply_markup=keyboard)
 
-@dp.callback_query(F.data == "recent_payments")
+@callbacks.action("recent_payments")
 async def callback_recent_payments(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
-    payments = await db.list_payments(limit=10)
+    payments = await db.list_payments_with_users(limit=10)
     if not payments:
         text = "📊 *Recent Payments* 📊\n\nNo recent payments found."
     else:
         lines = ["📊 *Recent Payments* 📊\n"]
         for p in payments:
             t = iso_to_date(p["paid_at"])
-            user_info = await db.get_user(p["user_id"])
-            username = f"@{user_info['username']}" if user_info and user_info['username'] else f"ID:{p['user_id']}"
+            username = member_tag(p["user_id"], p["username"])
             lines.append(f"• {t.strftime('%m/%d')} {username}: {pretty_money(p['amount'])} ({p['months']}mo)")
         text = "\n".join(lines)
     
@@ -1242,33 +1345,47 @@ async def callback_recent_payments(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "system_status")
+@callbacks.action("system_status")
 async def callback_system_status(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
-    users = await db.all_users()
-    all_payments = await db.list_payments()
-    
-    total_users = len(users)
-    total_payments = len(all_payments)
-    total_revenue = sum(p['amount'] for p in all_payments)
-    total_months_sold = sum(p['months'] for p in all_payments)
+    stats = await db.payment_stats()
+    months = await db.monthly_revenue(6)
+    cache = coverage.stats()
+    members = profiles.stats()
+    outbox = await db.outbox_stats()
+    queue = update_scheduler.stats()
     
-    active_users = len([u for u in users if not u['muted_until']])
-    muted_users = total_users - active_users
+    monthly_lines = "".join(
+        f"• {m['month']}: {m['payments']} payments, {pretty_money(m['revenue'])}\n" for m in months
+    ) or "• No payments yet\n"
     
     text = (
         "📊 *Full System Status* 📊\n\n"
         f"👥 **Users:**\n"
-        f"• Total registered: {total_users}\n"
-        f"• Active users: {active_users}\n"
-        f"• Muted users: {muted_users}\n\n"
+        f"• Total registered: {stats['total_users']}\n"
+        f"• Active users: {stats['active_users']}\n"
+        f"• Muted users: {stats['muted_users']}\n\n"
         f"💰 **Financials:**\n"
-        f"• Total payments: {total_payments}\n"
-        f"• Total revenue: {pretty_money(total_revenue)}\n"
-        f"• Total months sold: {total_months_sold}\n\n"
+        f"• Total payments: {stats['total_payments']}\n"
+        f"• Total revenue: {pretty_money(stats['total_revenue'])}\n"
+        f"• Total months sold: {stats['total_months']}\n\n"
+        f"📅 **Monthly (last 6):**\n"
+        f"{monthly_lines}\n"
+        f"🧠 **Coverage cache:**\n"
+        f"• Hits: {cache['hits']}, misses: {cache['misses']} ({cache['hit_rate']:.0%} hit rate)\n"
+        f"• Profile writes: {members['writes']}, avoided: {members['writes_avoided']}, "
+        f"lookups from cache: {members['lookups_cached']}\n\n"
+        f"📬 **Reminder outbox:**\n"
+        f"• Pending: {outbox.get('pending', 0)}, sent: {outbox.get('sent', 0)}, "
+        f"failed: {outbox.get('failed', 0)}, unknown: {outbox.get('unknown', 0)}\n\n"
+        f"📥 **Update queue:**\n"
+        f"• Running: {queue['running']}/{queue['workers']}, waiting for a worker: {queue['waiting_worker']}, "
+        f"behind the same user: {queue['waiting_user']}\n"
+        f"• Processed: {queue['processed']}, avg wait: {queue['avg_wait_ms']:.1f} ms, "
+        f"deepest user queue: {queue['max_depth']}\n\n"
         f"⚙️ **Settings:**\n"
         f"• Monthly amount: {pretty_money(MONTHLY_AMOUNT)}\n"
         f"• Billing day: {BILLING_DAY}\n"
@@ -1279,54 +1396,19 @@ async def callback_system_status(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "overdue_users")
+@callbacks.action("overdue_users")
 async def callback_overdue_users(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
         return
     
-    users = await db.all_users()
-    if not users:
-        text = "⚠️ *Overdue Users* ⚠️\n\nNo users registered yet."
-    else:
-        tz = ZoneInfo(TZNAME)
-        today = datetime.now(tz).date()
-        overdue_users = []
-        
-        for u in users:
-            payments = await db.list_payments(u["user_id"], limit=1000)
-            if payments:
-                payments_sorted = sorted(payments, key=lambda p: p["paid_at"])
-                from utils import compute_coverage_until
-                last_cov = iso_to_date(payments_sorted[0]["paid_at"])
-                last_cov = last_cov.replace(day=1)
-                for p in payments_sorted:
-                    last_cov = compute_coverage_until(iso_to_date(p["paid_at"]), int(p["months"]), BILLING_DAY)
-                
-                if last_cov < today:  # Coverage ended
-                    days_overdue = (today - last_cov).days
-                    overdue_users.append((u, days_overdue))
-            else:
-                # No payments, consider overdue
-                overdue_users.append((u, 0))
-        
-        if not overdue_users:
-            text = "✅ *Overdue Users* ✅\n\nAll users are up to date!"
-        else:
-            lines = ["⚠️ *Overdue Users* ⚠️\n"]
-            for u, days in overdue_users:
-                username = f"@{u['username']}" if u['username'] else f"ID:{u['user_id']}"
-                if days == 0:
-                    lines.append(f"• {username}: No payments recorded")
-                else:
-                    lines.append(f"• {username}: {days} days overdue")
-            text = "\n".join(lines)
+    text = overdue_report(await coverage.all(), local_today(TZNAME))
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Back", callback_data="admin_quick_actions")]])
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer()
 
-@dp.callback_query(F.data == "refresh_data")
+@callbacks.action("refresh_data")
 async def callback_refresh_data(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -1344,7 +1426,7 @@ async def callback_refresh_data(callback: CallbackQuery):
     await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
     await callback.answer("Data refreshed successfully!")
 
-@dp.callback_query(F.data == "send_reminders")
+@callbacks.action("send_reminders")
 async def callback_send_reminders(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("Access denied", show_alert=True)
@@ -1367,36 +1449,11 @@ async def callback_send_reminders(callback: CallbackQuery):
 async def cmd_status(msg: Message):
     if not is_admin(msg.from_user.id):
         return
-    users = await db.all_users()
-    if not users:
+    statuses = await coverage.all()
+    if not statuses:
         return await msg.answer("No users registered yet.")
 
-    # build a concise status
-    tz = ZoneInfo(TZNAME)
-    today = datetime.now(tz).date()
-
-    lines = ["*Status:*"]
-    for u in users:
-        payments = await db.list_payments(u["user_id"], limit=1000)
-        if payments:
-            payments_sorted = sorted(payments, key=lambda p: p["paid_at"])
-            from utils import compute_coverage_until
-            last_cov = iso_to_date(payments_sorted[0]["paid_at"])
-            last_cov = last_cov.replace(day=1)
-            for p in payments_sorted:
-                last_cov = compute_coverage_until(iso_to_date(p["paid_at"]), int(p["months"]), BILLING_DAY)
-            due = next_billing_start(last_cov, BILLING_DAY)
-            status = f"covered through {last_cov.isoformat()}, next due {due.isoformat()}"
-        else:
-            # due on nearest anchor
-            anchor = date(today.year, today.month, 1).replace(day=min(BILLING_DAY, 28))
-            status = f"no payments yet, next due {anchor.isoformat()}"
-
-        mute = f", muted until {u['muted_until']}" if u["muted_until"] else ""
-        uname = f"@{u['username']}" if u["username"] else str(u["user_id"])
-        lines.append(f"• {uname}: {status}{mute}")
-
-    await msg.answer("\n".join(lines), parse_mode="Markdown")
+    await msg.answer(status_report("*Status:*", statuses, local_today(TZNAME)), parse_mode="Markdown")
 
 @dp.message(Command("setmute"))
 async def cmd_setmute(msg: Message, command: CommandObject):
@@ -1422,8 +1479,7 @@ async def cmd_setmute(msg: Message, command: CommandObject):
     if not row:
         return await msg.reply("User not found in database. Ask them to /start the bot once.")
 
-    tz = ZoneInfo(TZNAME)
-    today = datetime.now(tz).date()
+    today = local_today(TZNAME)
     until = today + relativedelta(months=+months)  # type: ignore
     # Reminders are muted until 'until' (exclusive)
     await db.set_muted_until(row["user_id"], until.isoformat())
@@ -1457,8 +1513,35 @@ async def cmd_setday(msg: Message, command: CommandObject):
         return await msg.reply("Day must be an integer between 1 and 28.")
     global BILLING_DAY
     BILLING_DAY = day
+    # Coverage dates and reminder timers are anchored on the billing day
+    await db.rebuild_coverage(BILLING_DAY)
+    if reminder_timers is not None:
+        reminder_timers.set_billing_day(BILLING_DAY)
     await msg.answer(f"Billing day set to {BILLING_DAY}.")
 
+@dp.message(Command("rebuildcoverage"))
+async def cmd_rebuildcoverage(msg: Message):
+    if not is_admin(msg.from_user.id):
+        return
+    count = await db.rebuild_coverage(BILLING_DAY)
+    await msg.answer(f"Coverage rebuilt for {count} users.")
+
+@dp.message(Command("simulate"))
+async def cmd_simulate(msg: Message, command: CommandObject):
+    if not is_admin(msg.from_user.id):
+        return
+    arg = (command.args or "").strip()
+    days = int(arg) if arg.isdigit() else 365 if not arg else 0
+    if not 1 <= days <= SIMULATE_MAX_DAYS:
+        return await msg.reply(f"Usage: `/simulate [days]` (1-{SIMULATE_MAX_DAYS}, default 365)", parse_mode="Markdown")
+    sim, result, loaded = await simulate(days, BILLING_DAY, tzname=TZNAME)
+    text = await asyncio.to_thread(report, sim, result, loaded)
+    if len(text) <= 3500:
+        return await msg.answer(f"🔮 Reminder dry run\n\n{text}")
+    await bot.send_document(chat_id=msg.chat.id,
+                            document=BufferedInputFile(text.encode("utf-8"), f"simulation-{days}d.txt"),
+                            caption=text.splitlines()[-1])
+
 @dp.message(Command("proof"))
 async def cmd_proof(msg: Message, command: CommandObject):
     if not is_admin(msg.from_user.id):
@@ -1518,56 +1601,103 @@ async def cmd_remove(msg: Message, command: CommandObject):
     await msg.answer(f"Removed user {target} and their payments.")
 
 @dp.message(Command("export"))
-async def cmd_export(msg: Message):
+async def cmd_export(msg: Message, command: CommandObject):
     if not is_admin(msg.from_user.id):
         return
-    rows = await db.export_all_payments()
-    if not rows:
-        return await msg.answer("No payments to export.")
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","user_id","username","first_name","last_name","amount","months","proof_file_id","paid_at"])
-    writer.writerows(rows)
-    output.seek(0)
-    data = io.BytesIO(output.getvalue().encode("utf-8"))
-    data.name = "payments.csv"
-    await bot.send_document(chat_id=msg.chat.id, document=data, caption="All payments export")
+    try:
+        compress, since, until = parse_export_args(command.args)
+    except ValueError:
+        return await msg.reply("Usage: `/export [gzip] [from YYYY-MM-DD] [to YYYY-MM-DD]` (start on or before end)", parse_mode="Markdown")
+    data, count = await build_export(compress, since, until)
+    with data:
+        if not count:
+            return await msg.answer("No payments to export.")
+        caption = "All payments export"
+        if since or until:
+            caption = f"Payments export ({since or '…'} – {until or '…'})"
+        await bot.send_document(chat_id=msg.chat.id,
+                                document=SpooledInputFile(data, export_filename(compress, since, until)),
+                                caption=caption)
 
 # ---------- Reminders ----------
 async def send_reminder_to_user(user_id:int):
-    try:
-        text = (
-            "⏰ *Payment Reminder* ⏰\n\n"
-            f"Hi! It's time to pay your Apple Music share of *{pretty_money(MONTHLY_AMOUNT)}*.\n\n"
-            "💡 Quick options:"
-        )
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT)} (1 month)", callback_data=f"pay_{MONTHLY_AMOUNT}_1")],
-            [InlineKeyboardButton(text="💳 Custom Amount", callback_data="pay_custom")],
-            [InlineKeyboardButton(text="📊 View History", callback_data="history")]
-        ])
-        
-        await bot.send_message(user_id, text, parse_mode="Markdown", reply_markup=keyboard)
-    except Exception as e:
-        print(f"[reminder] failed to message {user_id}: {e}")
+    """Send one reminder; errors propagate so the dispatcher can retry or count them."""
+    text = (
+        "⏰ *Payment Reminder* ⏰\n\n"
+        f"Hi! It's time to pay your Apple Music share of *{pretty_money(MONTHLY_AMOUNT)}*.\n\n"
+        "💡 Quick options:"
+    )
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"💰 Pay {pretty_money(MONTHLY_AMOUNT)} (1 month)", callback_data=pack("pay", MONTHLY_AMOUNT, 1))],
+        [InlineKeyboardButton(text="💳 Custom Amount", callback_data="pay_custom")],
+        [InlineKeyboardButton(text="📊 View History", callback_data="history")]
+    ])
+    
+    await bot.send_message(user_id, text, parse_mode="Markdown", reply_markup=keyboard)
+
+async def report_reminders(stats):
+    print(f"[reminder] sent={stats.sent} failed={stats.failed} retried={stats.retried} in {stats.duration:.1f}s")
+    if stats.total:
+        try:
+            await bot.send_message(ADMIN_ID, stats.summary(), parse_mode="Markdown")
+        except Exception as e:
+            print(f"[reminder] failed to report to admin: {e}")
+
+async def daily_reminders():
+    """Scheduled job: queue and send reminders for timezones reaching REMINDER_HOUR, and report the run to the admin."""
+    stats = await run_daily(send_reminder_to_user, BILLING_DAY, TZNAME, REMINDER_HOUR)
+    if stats.total:
+        await report_reminders(stats)
+
+async def retry_reminders():
+    """Scheduled job: deliver outbox reminders whose retry time has come."""
+    stats = await drain_outbox(send_reminder_to_user)
+    if stats.total:
+        await report_reminders(stats)
+
+async def event_reminders(due):
+    """ReminderTimers callback: send the reminders whose timers just fired."""
+    await report_reminders(await run_due(send_reminder_to_user, due))
 
 async def schedule_jobs():
-    tz = ZoneInfo(TZNAME)
-    # Daily at REMINDER_HOUR local time
+    if REMINDER_MODE == "event":
+        global reminder_timers
+        reminder_timers = ReminderTimers(event_reminders, BILLING_DAY, TZNAME, REMINDER_HOUR)
+        db.add_write_listener(reminder_timers.on_write)
+        restored = await reminder_timers.start()
+        print(f"[scheduler] Restored {restored} per-user reminder timers at {REMINDER_HOUR}:00 {TZNAME}.")
+    else:
+        # Each UTC-offset bucket of user timezones fires when it reaches REMINDER_HOUR local time
+        scheduler.add_job(
+            daily_reminders,
+            CronTrigger(minute=f"*/{BUCKET_MINUTES}", timezone=timezone.utc),
+            name="daily-reminders"
+        )
     scheduler.add_job(
-        lambda: asyncio.create_task(run_daily(send_reminder_to_user, BILLING_DAY, TZNAME)),
-        CronTrigger(hour=REMINDER_HOUR, minute=0, timezone=tz),
-        name="daily-reminders"
+        retry_reminders,
+        IntervalTrigger(minutes=OUTBOX_RETRY_MINUTES),
+        name="retry-reminders"
     )
     scheduler.start()
-    print(f"[scheduler] Reminders scheduled at {REMINDER_HOUR}:00 {TZNAME} daily.")
+    if REMINDER_MODE != "event":
+        print(f"[scheduler] Reminders scheduled at {REMINDER_HOUR}:00 in each user's timezone (default {TZNAME}).")
 
 # ---------- Startup ----------
 async def main():
-    await db.init_db()
+    await db.init_db(BILLING_DAY)
+    interrupted = await db.recover_outbox(time.time())
+    if interrupted:
+        print(f"[reminder] {interrupted} reminder(s) interrupted mid-send marked unknown (not resent)")
     await schedule_jobs()
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()  # getUpdates is refused while a webhook is set
+            await dp.start_polling(bot)
+    finally:
+        await db.close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
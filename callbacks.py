@@ -0,0 +1,148 @@
+"""
+Callback-query routing and the compact callback_data encoding.
+
+aiogram checks callback handlers one filter at a time, so every button press
+used to walk the whole list of `F.data == ...` handlers. CallbackRouter is
+registered as the single callback handler and finds the target with one dict
+lookup, however many menus there are.
+
+callback_data layout (Telegram allows 64 bytes):
+
+    <action>                               no arguments, e.g. "main_menu"
+    <action>:<version>:<arg>[:<arg>...]    e.g. "pay:1:2.5:1"
+
+Handlers are registered with their argument types and get them parsed:
+`async def handler(callback, *args)`. Bump VERSION (or an action's own
+version) when an argument layout changes; buttons left in old messages then
+get a polite "expired" answer, or the action's default view if it was
+registered with fallback=True. Data from before this encoding
+("pay_2.5_1", "delete_payment_7", ...) is translated by legacy prefixes kept
+in a character trie.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.types import CallbackQuery
+
+VERSION = 1
+SEP = ":"
+MAX_BYTES = 64
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class Route(NamedTuple):
+    handler: Handler
+    types: Tuple[type, ...]
+    version: int
+    fallback: bool  # call the handler without arguments for data from another version
+
+
+def pack(action: str, *args, version: int = VERSION) -> str:
+    """Encode callback data for `action` with its arguments."""
+    if not args:
+        return action
+    data = SEP.join([action, str(version), *(_format(a) for a in args)])
+    if len(data.encode("utf-8")) > MAX_BYTES:
+        raise ValueError(f"callback data over {MAX_BYTES} bytes: {data}")
+    return data
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return "%.15g" % value  # 2.5 -> "2.5", 10.0 -> "10"
+    return str(value)
+
+
+class _Trie:
+    """Longest-prefix lookup over a few legacy callback prefixes."""
+
+    def __init__(self):
+        self._root: Dict[str, Any] = {}
+
+    def add(self, prefix: str, value):
+        node = self._root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[None] = value
+
+    def match(self, data: str) -> Tuple[Optional[Any], str]:
+        """(value of the longest registered prefix of data, rest of data), or (None, data)."""
+        node, found, rest = self._root, None, data
+        for i, ch in enumerate(data):
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found, rest = node[None], data[i + 1:]
+        return found, rest
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._routes: Dict[str, Route] = {}
+        self._legacy = _Trie()
+        self.dispatched = 0
+        self.unknown = 0
+
+    def action(self, name: str, *types: type, version: int = VERSION, fallback: bool = False):
+        """Decorator: route callback data for `name` to the handler, parsing args as `types`."""
+        if SEP in name:
+            raise ValueError(f"action name may not contain {SEP!r}: {name}")
+
+        def register(handler: Handler) -> Handler:
+            if name in self._routes:
+                raise ValueError(f"callback action registered twice: {name}")
+            self._routes[name] = Route(handler, types, version, fallback)
+            return handler
+        return register
+
+    def legacy(self, prefix: str, action: str):
+        """Translate old `<prefix><arg>_<arg>...` data to `action` with those args."""
+        self._legacy.add(prefix, action)
+
+    def resolve(self, data: str) -> Tuple[Optional[Route], Optional[List[Any]]]:
+        """
+        (route, parsed args) for callback data. args is None when the data is
+        from another version of the action's layout or doesn't parse; route is
+        None for unknown actions.
+        """
+        name, _, rest = (data or "").partition(SEP)
+        route = self._routes.get(name)
+        if route is not None:
+            if not rest:
+                return route, [] if not route.types else None
+            version, _, raw = rest.partition(SEP)
+            if version != str(route.version):
+                return route, None
+            return route, _parse(route.types, raw.split(SEP))
+        action, rest = self._legacy.match(data or "")
+        if action is not None:
+            route = self._routes[action]
+            return route, _parse(route.types, rest.split("_"))
+        return None, None
+
+    def actions(self) -> List[str]:
+        return list(self._routes)
+
+    async def dispatch(self, callback: CallbackQuery):
+        route, args = self.resolve(callback.data)
+        if route is None:
+            self.unknown += 1
+            await callback.answer("Unknown action", show_alert=True)
+            return
+        self.dispatched += 1
+        if args is None:
+            if not route.fallback:
+                await callback.answer("⚠️ This button has expired. Please open the menu again.", show_alert=True)
+                return
+            args = []
+        await route.handler(callback, *args)
+
+
+def _parse(types: Tuple[type, ...], raw: List[str]) -> Optional[List[Any]]:
+    if len(raw) != len(types):
+        return None
+    try:
+        return [t(value) for t, value in zip(types, raw)]
+    except ValueError:
+        return None
@@ -0,0 +1,160 @@
+"""
+Coverage status of users, computed in one place.
+
+database.py keeps each user's covered_through/next_due materialized in
+user_coverage. CoverageService turns those rows into CoverageStatus values
+carrying the same rules for every caller: the mute window, and the first due
+date of users who have never paid. Statuses are cached in-process per user,
+keyed by a version counter that database write listeners bump after
+add_payment, delete_payment, remove_user, set_muted_until and profile
+updates, so a status read before a write is never served after it.
+"""
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import database as db
+from utils import add_months_anchor, iso_to_date
+
+
+def first_due(today: date, billing_day: int) -> date:
+    """Due date of a user who has never paid: this month's billing anchor."""
+    return add_months_anchor(today.replace(day=1), 0, billing_day)
+
+
+class CoverageStatus(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    muted_until: Optional[date]
+    timezone: Optional[str]           # None: the bot's default
+    covered_through: Optional[date]   # None if never paid
+    next_due: Optional[date]          # None if never paid
+
+    @classmethod
+    def from_row(cls, row) -> "CoverageStatus":
+        return cls(
+            row["user_id"], row["username"], row["first_name"], row["last_name"],
+            iso_to_date(row["muted_until"]) if row["muted_until"] else None,
+            row["timezone"],
+            iso_to_date(row["covered_through"]) if row["covered_through"] else None,
+            iso_to_date(row["next_due"]) if row["next_due"] else None,
+        )
+
+    def is_muted(self, today: date) -> bool:
+        return self.muted_until is not None and today < self.muted_until
+
+    def due_date(self, today: date, billing_day: int) -> date:
+        return self.next_due or first_due(today, billing_day)
+
+    def is_due(self, today: date, billing_day: int) -> bool:
+        """Whether a reminder is owed today: due (or overdue) and not muted."""
+        return not self.is_muted(today) and today >= self.due_date(today, billing_day)
+
+    def next_reminder(self, today: date, billing_day: int) -> Tuple[date, date]:
+        """
+        (day, due date) of the first reminder owed on or after today: the day
+        is_due() first holds, and the due date it is for. Users who never paid
+        are due at the billing anchor of the month the reminder falls in.
+        """
+        start = max(today, self.muted_until) if self.muted_until else today
+        due = self.next_due or first_due(start, billing_day)
+        return max(due, start), due
+
+
+class CoverageService:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._versions: Dict[int, int] = {}
+        self._cache: Dict[int, Tuple[int, Optional[CoverageStatus]]] = {}
+        # all() reuses the user list of its last full load until a user is added or removed
+        self._generation = 0
+        self._user_ids: Optional[Tuple[int, List[int]]] = None
+        self._listed = set()
+
+    def on_write(self, event: str, user_id: Optional[int]):
+        """database write listener."""
+        if user_id is None:
+            self._cache.clear()
+            self._generation += 1
+            return
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        if event == "user_removed" or (event == "user" and user_id not in self._listed):
+            self._generation += 1
+
+    def _cached(self, user_id: int) -> Optional[Tuple[int, Optional[CoverageStatus]]]:
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] == self._versions.get(user_id, 0):
+            return entry
+        return None
+
+    def _store(self, rows, versions: Dict[int, int]) -> Dict[int, CoverageStatus]:
+        statuses = {}
+        for row in rows:
+            status = CoverageStatus.from_row(row)
+            self._cache[status.user_id] = (versions.get(status.user_id, 0), status)
+            statuses[status.user_id] = status
+        return statuses
+
+    async def get(self, user_id: int) -> Optional[CoverageStatus]:
+        """Coverage status of one user, or None if the user is unknown."""
+        entry = self._cached(user_id)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        # Versions are read before the query: a write landing meanwhile makes this entry stale.
+        version = self._versions.get(user_id, 0)
+        row = await db.get_user_with_coverage(user_id)
+        status = CoverageStatus.from_row(row) if row else None
+        self._cache[user_id] = (version, status)
+        return status
+
+    async def all(self) -> List[CoverageStatus]:
+        """Coverage status of every user; only entries invalidated since the last call are reloaded."""
+        if self._user_ids is None or self._user_ids[0] != self._generation:
+            generation, versions = self._generation, dict(self._versions)
+            rows = await db.all_users_with_coverage()
+            self.misses += len(rows)
+            statuses = self._store(rows, versions)
+            self._user_ids = (generation, list(statuses))
+            self._listed = set(statuses)
+            return list(statuses.values())
+
+        ids = self._user_ids[1]
+        statuses = {}
+        stale = []
+        for user_id in ids:
+            entry = self._cached(user_id)
+            if entry is None:
+                stale.append(user_id)
+            elif entry[1] is not None:
+                statuses[user_id] = entry[1]
+        self.hits += len(ids) - len(stale)
+        self.misses += len(stale)
+        if stale:
+            versions = dict(self._versions)
+            statuses.update(self._store(await db.all_users_with_coverage(stale), versions))
+        return [statuses[user_id] for user_id in ids if user_id in statuses]
+
+    async def due(self, today: date, billing_day: int,
+                  timezones: Optional[List[Optional[str]]] = None) -> List[int]:
+        """
+        User ids owed a reminder today (same rule as CoverageStatus.is_due), read
+        from the due-date index; with timezones, only users in those zones.
+        """
+        return await db.due_user_ids(today.isoformat(), today >= first_due(today, billing_day), timezones)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached": len(self._cache),
+        }
+
+
+coverage = CoverageService()
+db.add_write_listener(coverage.on_write)
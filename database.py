@@ -1,50 +1,603 @@
+import os
+import asyncio
 import aiosqlite
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple, AsyncIterator, Iterable
+
+import numpy as np
+
+import migrations
+from utils import compute_coverage_until, next_billing_start, iso_to_date, coverage_arrays, latest_per_group
 
 DB_PATH = Path(__file__).parent / "database.db"
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+FETCH_CHUNK_SIZE = 500  # rows per fetchmany() when streaming large result sets
+COVERAGE_CHUNK_SIZE = 50000  # payments per vectorized step when rebuilding coverage
+
+# ---------- Storage profile ----------
+# Applied to every pooled connection. journal_mode is persistent in the file,
+# the rest are per-connection settings.
+JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL").upper()
+SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))   # negative = KiB, positive = pages
+TEMP_STORE = os.getenv("DB_TEMP_STORE", "MEMORY").upper()
+
+# ---------- Group commit ----------
+# Writes are queued and applied by a single flusher task. Everything queued
+# within one flush window is committed in one transaction; each caller's await
+# returns only after the transaction holding its write has committed.
+FLUSH_WINDOW_MS = float(os.getenv("DB_FLUSH_WINDOW_MS", "0"))
+MAX_WRITE_BATCH = int(os.getenv("DB_MAX_WRITE_BATCH", "256"))
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_TEMP_STORES = {"DEFAULT", "FILE", "MEMORY"}
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+# Billing day the user_coverage table is computed with; set by init_db() and
+# rebuild_coverage().
+_billing_day = 1
+
+# ---------- Row records ----------
+# Compact __slots__ records produced directly by a cursor row factory. They
+# also support the read-only dict-style access (row["key"], row.get(),
+# dict(row)) that callers used when rows were plain dicts.
+class Record:
+    __slots__ = ()
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return cls(*row)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            return default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__slots__
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Record):
+    __slots__ = ("user_id", "username", "first_name", "last_name", "muted_until", "timezone")
+
+    def __init__(self, user_id, username, first_name, last_name, muted_until, timezone):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.muted_until = muted_until
+        self.timezone = timezone
+
+
+class UserCoverage(Record):
+    """A user joined with their materialized coverage (None dates if never paid)."""
+    __slots__ = ("user_id", "username", "first_name", "last_name", "muted_until", "timezone",
+                 "covered_through", "next_due")
+
+    def __init__(self, user_id, username, first_name, last_name, muted_until, timezone, covered_through, next_due):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.muted_until = muted_until
+        self.timezone = timezone
+        self.covered_through = covered_through
+        self.next_due = next_due
+
+
+class Payment(Record):
+    __slots__ = ("id", "user_id", "amount", "months", "proof_file_id", "paid_at", "created_at")
+
+    def __init__(self, id, user_id, amount, months, proof_file_id, paid_at, created_at):
+        self.id = id
+        self.user_id = user_id
+        self.amount = amount
+        self.months = months
+        self.proof_file_id = proof_file_id
+        self.paid_at = paid_at
+        self.created_at = created_at
+
+
+class PaymentWithUser(Record):
+    """A payment joined with its user's display fields (None if the user row is gone)."""
+    __slots__ = ("id", "user_id", "amount", "months", "proof_file_id", "paid_at", "created_at",
+                 "username", "first_name", "last_name")
+
+    def __init__(self, id, user_id, amount, months, proof_file_id, paid_at, created_at,
+                 username, first_name, last_name):
+        self.id = id
+        self.user_id = user_id
+        self.amount = amount
+        self.months = months
+        self.proof_file_id = proof_file_id
+        self.paid_at = paid_at
+        self.created_at = created_at
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+
+class PendingPayment(Record):
+    __slots__ = ("user_id", "amount", "months")
+
+    def __init__(self, user_id, amount, months):
+        self.user_id = user_id
+        self.amount = amount
+        self.months = months
+
+
+class Coverage(Record):
+    __slots__ = ("user_id", "covered_through", "next_due", "last_payment_id", "version")
+
+    def __init__(self, user_id, covered_through, next_due, last_payment_id, version):
+        self.user_id = user_id
+        self.covered_through = covered_through
+        self.next_due = next_due
+        self.last_payment_id = last_payment_id
+        self.version = version
+
+
+class OutboxItem(Record):
+    __slots__ = ("id", "user_id", "due_date", "attempts")
+
+    def __init__(self, id, user_id, due_date, attempts):
+        self.id = id
+        self.user_id = user_id
+        self.due_date = due_date
+        self.attempts = attempts
+
+
+async def _fetchone(db: aiosqlite.Connection, record: type, sql: str, params=()) -> Optional[Record]:
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = record.row_factory
+    return await cursor.fetchone()
+
+
+async def _fetchall(db: aiosqlite.Connection, record: type, sql: str, params=()) -> List[Record]:
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = record.row_factory
+    return list(await cursor.fetchall())
+
+
+# ---------- Connection manager ----------
+# One long-lived writer connection owned by the flusher task and a small pool
+# of reader connections, opened by init_db() and closed by close_db().
+_writer: Optional[aiosqlite.Connection] = None
+_write_queue: Optional[asyncio.Queue] = None
+_flusher: Optional[asyncio.Task] = None
+_readers: Optional[asyncio.Queue] = None
+_reader_conns: List[aiosqlite.Connection] = []
+_open_lock: Optional[asyncio.Lock] = None
+
+
+def _pragma_profile() -> List[str]:
+    if JOURNAL_MODE not in _JOURNAL_MODES:
+        raise ValueError(f"DB_JOURNAL_MODE must be one of {sorted(_JOURNAL_MODES)}")
+    if SYNCHRONOUS not in _SYNCHRONOUS_MODES:
+        raise ValueError(f"DB_SYNCHRONOUS must be one of {sorted(_SYNCHRONOUS_MODES)}")
+    if TEMP_STORE not in _TEMP_STORES:
+        raise ValueError(f"DB_TEMP_STORE must be one of {sorted(_TEMP_STORES)}")
+    return [
+        f"PRAGMA journal_mode={JOURNAL_MODE}",
+        f"PRAGMA synchronous={SYNCHRONOUS}",
+        f"PRAGMA mmap_size={MMAP_SIZE}",
+        f"PRAGMA cache_size={CACHE_SIZE}",
+        f"PRAGMA temp_store={TEMP_STORE}",
+    ]
+
+
+async def _connect(isolation_level: Optional[str] = "") -> aiosqlite.Connection:
+    conn = aiosqlite.connect(DB_PATH, isolation_level=isolation_level)
+    # aiosqlite runs each connection on its own thread. Make it a daemon so a
+    # script that returns without close_db() still exits; callers only see a
+    # write succeed after its COMMIT, so nothing acknowledged is lost.
+    conn.daemon = True
+    await conn
+    conn.row_factory = aiosqlite.Row
+    for pragma in _pragma_profile():
+        await conn.execute(pragma)
+    return conn
+
+
+async def open_pool():
+    """Open the writer connection, its flusher task and the reader pool (idempotent)."""
+    global _writer, _write_queue, _flusher, _readers, _open_lock
+    if _open_lock is None:
+        _open_lock = asyncio.Lock()
+    async with _open_lock:
+        if _writer is not None:
+            return
+        # The writer manages its own transactions (BEGIN/SAVEPOINT/COMMIT).
+        writer = await _connect(isolation_level=None)
+        readers = asyncio.Queue()
+        for _ in range(max(1, READ_POOL_SIZE)):
+            conn = await _connect()
+            _reader_conns.append(conn)
+            readers.put_nowait(conn)
+        _readers = readers
+        _write_queue = asyncio.Queue()
+        _writer = writer
+        _flusher = asyncio.create_task(_flush_loop())
+
+
+async def close_db():
+    """Flush queued writes and close all pooled connections. Safe to call more than once."""
+    global _writer, _write_queue, _flusher, _readers
+    if _flusher is not None and not _flusher.done():
+        _write_queue.put_nowait(None)  # sentinel: drain everything queued before it
+        await _flusher
+    if _writer is not None:
+        await _writer.close()
+    for conn in _reader_conns:
+        await conn.close()
+    _reader_conns.clear()
+    _writer = None
+    _write_queue = None
+    _flusher = None
+    _readers = None
+
+
+async def _flush_loop():
+    while True:
+        item = await _write_queue.get()
+        if item is None:
+            return
+        batch = [item]
+        if FLUSH_WINDOW_MS > 0:
+            await asyncio.sleep(FLUSH_WINDOW_MS / 1000)
+        else:
+            await asyncio.sleep(0)  # let writers scheduled in the same tick join
+        stop = False
+        while len(batch) < MAX_WRITE_BATCH and not _write_queue.empty():
+            item = _write_queue.get_nowait()
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        try:
+            await _commit_batch(batch)
+        except Exception as e:
+            # The batch's callers have already been failed; keep serving later writes.
+            print(f"[db] write batch of {len(batch)} failed: {e}")
+        if stop:
+            return
+
+
+async def _rollback():
+    try:
+        if _writer.in_transaction:
+            await _writer.execute("ROLLBACK")
+    except Exception as e:
+        print(f"[db] rollback failed: {e}")
+
+
+async def _commit_batch(batch: List[Tuple[WriteOp, asyncio.Future]]):
+    """Apply a batch of write ops in one transaction, isolating each op in a savepoint."""
+    outcomes = []
+    committed = False
+    failure: Optional[BaseException] = None
+    try:
+        await _writer.execute("BEGIN IMMEDIATE")
+        for op, fut in batch:
+            await _writer.execute("SAVEPOINT write_op")
+            try:
+                outcomes.append((fut, await op(_writer), None))
+            except Exception as e:
+                await _writer.execute("ROLLBACK TO write_op")
+                outcomes.append((fut, None, e))
+            await _writer.execute("RELEASE write_op")
+        await _writer.execute("COMMIT")
+        committed = True
+    except BaseException as e:
+        failure = e
+        await _rollback()
+        raise
+    finally:
+        if committed:
+            for fut, result, error in outcomes:
+                if fut.done():
+                    continue
+                if error is not None:
+                    fut.set_exception(error)
+                else:
+                    fut.set_result(result)
+        else:
+            # Nothing in this batch is durable; fail every caller.
+            if not isinstance(failure, Exception):
+                failure = RuntimeError("write batch aborted")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(failure)
 
 
-async def init_db():
-    """Initialize database with required tables."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                muted_until TEXT
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                amount REAL,
-                months INTEGER,
-                proof_file_id TEXT,
-                paid_at TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS pending_payments (
-                user_id INTEGER PRIMARY KEY,
-                amount REAL,
-                months INTEGER,
-                FOREIGN KEY(user_id) REFERENCES users(user_id)
-            )
-        """)
-        await db.commit()
+async def _submit(op: WriteOp) -> Any:
+    """Queue a write op and wait until the transaction containing it has committed."""
+    if _writer is None:
+        await open_pool()
+    if _flusher.done():
+        raise RuntimeError("database writer has stopped; call close_db() and init_db() again")
+    fut = asyncio.get_running_loop().create_future()
+    _write_queue.put_nowait((op, fut))
+    return await fut
+
+
+async def _execute_write(sql: str, params: tuple = ()) -> int:
+    """Queue a single write statement. Returns the number of rows affected."""
+    async def op(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute(sql, params)
+        return cursor.rowcount
+    return await _submit(op)
+
+
+@asynccontextmanager
+async def _read():
+    """Borrow a reader connection from the pool."""
+    if _readers is None:
+        await open_pool()
+    conn = await _readers.get()
+    try:
+        yield conn
+    finally:
+        _readers.put_nowait(conn)
+
+
+# ---------- Write listeners ----------
+# Called as fn(event, user_id) once a write has committed; user_id is None for
+# bulk changes. Events: "user" (upsert), "payment" (added or deleted), "muted",
+# "user_removed" and "rebuild".
+_write_listeners: List[Callable[[str, Optional[int]], None]] = []
+
+
+def add_write_listener(fn: Callable[[str, Optional[int]], None]):
+    """Register a callback for committed writes (e.g. to invalidate caches)."""
+    _write_listeners.append(fn)
+
+
+def _notify(event: str, user_id: Optional[int] = None):
+    for fn in _write_listeners:
+        fn(event, user_id)
+
+
+async def init_db(billing_day: int = 1):
+    """
+    Open the connection pool, apply pending schema migrations (see migrations.py)
+    and rebuild coverage if it was built for a different billing day.
+    """
+    global _billing_day
+    _billing_day = billing_day
+    await migrations.migrate()
+
+    async def op(db: aiosqlite.Connection):
+        cursor = await db.execute("""
+            SELECT EXISTS(SELECT 1 FROM user_coverage WHERE billing_day != ?)
+                OR (NOT EXISTS(SELECT 1 FROM user_coverage) AND EXISTS(SELECT 1 FROM payments))
+        """, (billing_day,))
+        if (await cursor.fetchone())[0]:
+            await _rebuild_coverage(db)
+    await _submit(op)
+
+
+# ---------- Coverage ----------
+_COVERAGE_UPSERT = """
+    INSERT INTO user_coverage (user_id, covered_through, next_due, last_payment_id, billing_day, version)
+    VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT(user_id) DO UPDATE SET
+        covered_through=excluded.covered_through,
+        next_due=excluded.next_due,
+        last_payment_id=excluded.last_payment_id,
+        billing_day=excluded.billing_day,
+        version=user_coverage.version + 1
+"""
+
+
+def _coverage_for(paid_at: str, months: int) -> Tuple[str, str]:
+    covered = compute_coverage_until(iso_to_date(paid_at), int(months), _billing_day)
+    return covered.isoformat(), next_billing_start(covered, _billing_day).isoformat()
+
+
+async def _refresh_coverage(db: aiosqlite.Connection, user_id: int):
+    """Recompute one user's coverage row inside the caller's transaction."""
+    cursor = await db.execute(
+        "SELECT id, months, paid_at FROM payments WHERE user_id = ? ORDER BY paid_at DESC, id DESC LIMIT 1",
+        (user_id,)
+    )
+    latest = await cursor.fetchone()
+    covered_through = next_due = payment_id = None
+    if latest:
+        covered_through, next_due = _coverage_for(latest["paid_at"], latest["months"])
+        payment_id = latest["id"]
+    await db.execute(_COVERAGE_UPSERT, (user_id, covered_through, next_due, payment_id, _billing_day))
+
+
+async def _coverage_rows(db: aiosqlite.Connection, where: str = "", params: tuple = ()) -> List[tuple]:
+    """
+    Coverage upsert rows for every user with payments matching `where`, from one
+    ordered pass over payments. Each chunk is reduced to each user's latest
+    payment and run through the vectorized coverage engine in utils.
+    """
+    cursor = await db.execute(
+        f"SELECT user_id, id, paid_at, months FROM payments {where} ORDER BY user_id, paid_at DESC, id DESC",
+        params
+    )
+    cursor.row_factory = None
+    result, previous = [], None
+    while True:
+        rows = await cursor.fetchmany(COVERAGE_CHUNK_SIZE)
+        if not rows:
+            break
+        user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        first = latest_per_group(user_ids)
+        # a user's payments may continue from the previous chunk
+        first[0] = user_ids[0] != previous
+        previous = user_ids[-1]
+        latest = [rows[i] for i in np.flatnonzero(first)]
+        paid = np.array([r[2][:10] for r in latest], dtype="datetime64[D]")
+        months = np.fromiter((r[3] for r in latest), dtype=np.int64, count=len(latest))
+        covered, next_due = coverage_arrays(paid, months, _billing_day)
+        result.extend(
+            (r[0], c, n, r[1], _billing_day)
+            for r, c, n in zip(latest, covered.astype(str).tolist(), next_due.astype(str).tolist())
+        )
+    return result
+
+
+async def _rebuild_coverage(db: aiosqlite.Connection) -> int:
+    """Recompute every coverage row from payments. Returns the number of users covered."""
+    await db.execute("""
+        UPDATE user_coverage SET covered_through = NULL, next_due = NULL, last_payment_id = NULL,
+                                 billing_day = ?, version = version + 1
+    """, (_billing_day,))
+    rows = await _coverage_rows(db)
+    await db.executemany(_COVERAGE_UPSERT, rows)
+    await db.execute(
+        "INSERT OR IGNORE INTO user_coverage (user_id, billing_day) SELECT user_id, ? FROM users", (_billing_day,)
+    )
+    return len(rows)
+
+
+async def _backfill_coverage(db: aiosqlite.Connection, after_user_id: int, limit: int) -> Optional[int]:
+    """
+    Build coverage rows for the next `limit` paying users after after_user_id.
+    Returns the last user_id handled, or None once every user is done.
+    """
+    cursor = await db.execute(
+        "SELECT DISTINCT user_id FROM payments WHERE user_id > ? ORDER BY user_id LIMIT ?",
+        (after_user_id, limit)
+    )
+    user_ids = [row[0] for row in await cursor.fetchall()]
+    if not user_ids:
+        return None
+    rows = await _coverage_rows(db, "WHERE user_id > ? AND user_id <= ?", (after_user_id, user_ids[-1]))
+    await db.executemany(_COVERAGE_UPSERT, rows)
+    return user_ids[-1]
+
+
+async def rebuild_coverage(billing_day: Optional[int] = None) -> int:
+    """
+    Recompute the user_coverage table from payments (recovery, or after the
+    billing day changes). Returns the number of users with coverage.
+    """
+    global _billing_day
+    if billing_day is not None:
+        _billing_day = billing_day
+    count = await _submit(_rebuild_coverage)
+    _notify("rebuild")
+    return count
+
+
+async def get_coverage(user_id: int) -> Optional[Coverage]:
+    """Get the materialized coverage row for a user."""
+    async with _read() as db:
+        return await _fetchone(
+            db, Coverage,
+            "SELECT user_id, covered_through, next_due, last_payment_id, version FROM user_coverage WHERE user_id = ?",
+            (user_id,)
+        )
+
+
+_USER_COVERAGE_SELECT = """
+    SELECT u.user_id, u.username, u.first_name, u.last_name, u.muted_until, u.timezone,
+           c.covered_through, c.next_due
+    FROM users u
+    LEFT JOIN user_coverage c ON c.user_id = u.user_id
+"""
+
+
+async def all_users_with_coverage(user_ids: Optional[Iterable[int]] = None) -> List[UserCoverage]:
+    """Return all users (or only user_ids) joined with their covered_through/next_due (None if never paid)."""
+    async with _read() as db:
+        if user_ids is None:
+            return await _fetchall(db, UserCoverage, _USER_COVERAGE_SELECT)
+        ids = sorted(set(user_ids))
+        result = []
+        for i in range(0, len(ids), FETCH_CHUNK_SIZE):
+            batch = ids[i:i + FETCH_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            result.extend(await _fetchall(
+                db, UserCoverage, f"{_USER_COVERAGE_SELECT} WHERE u.user_id IN ({placeholders})", batch
+            ))
+        return result
+
+
+def _due_sql(columns: str, include_unpaid: bool, timezones: Optional[List[Optional[str]]] = None) -> str:
+    """
+    SELECT `columns` for users due on :today and not muted. `{due_date}` in
+    columns is their due date: next_due, or :first_due for users who never paid.
+    With timezones, only users in those zones (None: no zone set), bound as :tz0, :tz1, ...
+    """
+    sql = """
+        SELECT {columns} FROM user_coverage c JOIN users u ON u.user_id = c.user_id
+        WHERE {due} AND (u.muted_until IS NULL OR u.muted_until <= :today)
+    """
+    if timezones is not None:
+        # unary + keeps the planner on idx_coverage_next_due: a zone can hold most users
+        named = [f":tz{i}" for i, tz in enumerate(timezones) if tz is not None]
+        zones = [f"+u.timezone IN ({', '.join(named)})"] if named else []
+        if None in timezones:
+            zones.append("+u.timezone IS NULL")
+        sql += f" AND ({' OR '.join(zones)})"
+    query = sql.format(columns=columns.format(due_date="c.next_due"), due="c.next_due <= :today")
+    if include_unpaid:
+        query += " UNION ALL " + sql.format(columns=columns.format(due_date=":first_due"), due="c.next_due IS NULL")
+    return query
+
+
+def _zone_params(timezones: Optional[List[Optional[str]]]) -> Dict[str, str]:
+    return {f"tz{i}": tz for i, tz in enumerate(timezones or ()) if tz is not None}
+
+
+async def due_user_ids(today: str, include_unpaid: bool,
+                       timezones: Optional[List[Optional[str]]] = None) -> List[int]:
+    """
+    Return users whose next_due is on or before today (an ISO date) and who are
+    not muted; with include_unpaid, also users who never paid; with timezones,
+    only users in those zones. Only due rows are read (idx_coverage_next_due),
+    so the cost follows the number of due users.
+    """
+    async with _read() as db:
+        cursor = await db.execute(_due_sql("c.user_id", include_unpaid, timezones),
+                                  {"today": today, **_zone_params(timezones)})
+        return [row[0] for row in await cursor.fetchall()]
+
+
+async def get_user_with_coverage(user_id: int) -> Optional[UserCoverage]:
+    """Get a user joined with their covered_through/next_due."""
+    async with _read() as db:
+        return await _fetchone(db, UserCoverage, f"{_USER_COVERAGE_SELECT} WHERE u.user_id = ?", (user_id,))
 
 
 async def upsert_user(user_id: int, username: str, first_name: str, last_name: str):
-    """Insert or update user information."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    """Insert or update user information (new users get an empty coverage row)."""
+    async def op(db: aiosqlite.Connection):
         await db.execute("""
             INSERT INTO users (user_id, username, first_name, last_name)
             VALUES (?, ?, ?, ?)
@@ -53,176 +606,354 @@ async def upsert_user(user_id: int, username: str, first_name: str, last_name: s
                 first_name=excluded.first_name,
                 last_name=excluded.last_name
         """, (user_id, username, first_name, last_name))
-        await db.commit()
+        await db.execute(
+            "INSERT OR IGNORE INTO user_coverage (user_id, billing_day) VALUES (?, ?)", (user_id, _billing_day)
+        )
+    await _submit(op)
+    _notify("user", user_id)
 
 
-async def get_user(user_id: int) -> Optional[Dict[str, Any]]:
+async def get_user(user_id: int) -> Optional[User]:
     """Get user by user_id."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT user_id, username, first_name, last_name, muted_until FROM users WHERE user_id = ?", 
+    async with _read() as db:
+        return await _fetchone(
+            db, User,
+            "SELECT user_id, username, first_name, last_name, muted_until, timezone FROM users WHERE user_id = ?",
             (user_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
 
 
-async def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+async def get_user_by_username(username: str) -> Optional[User]:
     """Get user by username."""
     username = username.lstrip('@')  # Remove @ if present
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT user_id, username, first_name, last_name, muted_until FROM users WHERE username = ?", 
+    async with _read() as db:
+        return await _fetchone(
+            db, User,
+            "SELECT user_id, username, first_name, last_name, muted_until, timezone FROM users WHERE username = ?",
             (username,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
 
 
-async def all_users() -> List[Dict[str, Any]]:
+async def all_users() -> List[User]:
     """Return all users."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("SELECT user_id, username, first_name, last_name, muted_until FROM users")
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
-
-
-async def list_payments(user_id: int = None, limit: int = None) -> List[Dict[str, Any]]:
+    async with _read() as db:
+        return await _fetchall(db, User, "SELECT user_id, username, first_name, last_name, muted_until, timezone FROM users")
+
+
+async def _page_payments(record: type, columns: str, joins: str, user_id: Optional[int], limit: Optional[int],
+                         before: Optional[Tuple[str, int]], after: Optional[Tuple[str, int]]) -> List[Record]:
+    conditions, params = [], []
+    if user_id:
+        conditions.append("p.user_id = ?")
+        params.append(user_id)
+    if before:
+        conditions.append("(p.created_at, p.id) < (?, ?)")
+        params.extend(before)
+    if after:
+        conditions.append("(p.created_at, p.id) > (?, ?)")
+        params.extend(after)
+    # Walking forward from `after` reads the index upwards, then flips the page.
+    order = "ASC" if after and not before else "DESC"
+    sql = f"SELECT {columns} FROM payments p{joins}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY p.created_at {order}, p.id {order}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    async with _read() as db:
+        payments = await _fetchall(db, record, sql, params)
+    if order == "ASC":
+        payments.reverse()
+    return payments
+
+
+async def list_payments(user_id: int = None, limit: int = None,
+                        before: Optional[Tuple[str, int]] = None,
+                        after: Optional[Tuple[str, int]] = None) -> List[Payment]:
     """
-    Return all payments or payments for a specific user.
+    Return all payments or payments for a specific user, newest first.
+
+    `before` and `after` are (created_at, id) keyset cursors: the page holds the
+    `limit` payments just older than `before`, or just newer than `after`.
+    Either way the cost depends on the page size, not on how deep it is.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        if user_id:
-            if limit:
-                cursor = await db.execute(
-                    "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-                    (user_id, limit)
-                )
-            else:
-                cursor = await db.execute(
-                    "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments WHERE user_id = ? ORDER BY created_at DESC",
-                    (user_id,)
-                )
-        else:
-            if limit:
-                cursor = await db.execute(
-                    "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments ORDER BY created_at DESC LIMIT ?",
-                    (limit,)
-                )
-            else:
-                cursor = await db.execute(
-                    "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments ORDER BY created_at DESC"
-                )
-        rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+    return await _page_payments(
+        Payment, "p.id, p.user_id, p.amount, p.months, p.proof_file_id, p.paid_at, p.created_at", "",
+        user_id, limit, before, after
+    )
+
+
+async def list_payments_with_users(user_id: int = None, limit: int = None,
+                                   before: Optional[Tuple[str, int]] = None,
+                                   after: Optional[Tuple[str, int]] = None) -> List[PaymentWithUser]:
+    """list_payments with each payment's username and names joined in, so a page is one query."""
+    return await _page_payments(
+        PaymentWithUser,
+        "p.id, p.user_id, p.amount, p.months, p.proof_file_id, p.paid_at, p.created_at, "
+        "u.username, u.first_name, u.last_name",
+        " LEFT JOIN users u ON u.user_id = p.user_id",
+        user_id, limit, before, after
+    )
 
 
 async def add_payment(user_id: int, amount: float, months: int, proof_file_id: str, paid_at_iso: str):
-    """Insert a payment for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    """Insert a payment for a user and update their coverage in the same transaction."""
+    async def op(db: aiosqlite.Connection):
         await db.execute(
             "INSERT INTO payments (user_id, amount, months, proof_file_id, paid_at) VALUES (?, ?, ?, ?, ?)",
             (user_id, amount, months, proof_file_id, paid_at_iso)
         )
-        await db.commit()
+        await _refresh_coverage(db, user_id)
+    await _submit(op)
+    _notify("payment", user_id)
 
 
-async def latest_payment(user_id: int) -> Optional[Dict[str, Any]]:
+async def latest_payment(user_id: int) -> Optional[Payment]:
     """Get the latest payment for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
-            "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+    async with _read() as db:
+        return await _fetchone(
+            db, Payment,
+            "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
             (user_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
 
 
 async def set_pending(user_id: int, amount: float, months: int):
     """Set pending payment for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        await db.execute(
-            "INSERT OR REPLACE INTO pending_payments (user_id, amount, months) VALUES (?, ?, ?)",
-            (user_id, amount, months)
-        )
-        await db.commit()
+    await _execute_write(
+        "INSERT OR REPLACE INTO pending_payments (user_id, amount, months) VALUES (?, ?, ?)",
+        (user_id, amount, months)
+    )
 
 
-async def get_pending(user_id: int) -> Optional[Dict[str, Any]]:
+async def get_pending(user_id: int) -> Optional[PendingPayment]:
     """Get pending payment for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
+    async with _read() as db:
+        return await _fetchone(
+            db, PendingPayment,
             "SELECT user_id, amount, months FROM pending_payments WHERE user_id = ?",
             (user_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
 
 
 async def clear_pending(user_id: int):
     """Clear pending payment for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM pending_payments WHERE user_id = ?", (user_id,))
-        await db.commit()
+    await _execute_write("DELETE FROM pending_payments WHERE user_id = ?", (user_id,))
 
 
 async def set_muted_until(user_id: int, muted_until: str):
     """Set muted_until date for a user."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET muted_until = ? WHERE user_id = ?",
-            (muted_until, user_id)
-        )
-        await db.commit()
+    await _execute_write(
+        "UPDATE users SET muted_until = ? WHERE user_id = ?",
+        (muted_until, user_id)
+    )
+    _notify("muted", user_id)
+
+
+async def set_timezone(user_id: int, timezone: Optional[str]):
+    """Set a user's IANA timezone name (None: the bot's default)."""
+    await _execute_write("UPDATE users SET timezone = ? WHERE user_id = ?", (timezone, user_id))
+    _notify("timezone", user_id)
+
+
+async def user_timezones() -> List[Optional[str]]:
+    """Distinct timezones set on users (None for users on the default)."""
+    async with _read() as db:
+        cursor = await db.execute("SELECT DISTINCT timezone FROM users")
+        return [row[0] for row in await cursor.fetchall()]
 
 
 async def remove_user(user_id: int) -> int:
     """Remove a user and all their data. Returns number of rows affected."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async def op(db: aiosqlite.Connection):
         await db.execute("DELETE FROM pending_payments WHERE user_id = ?", (user_id,))
         await db.execute("DELETE FROM payments WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM user_coverage WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM outbox WHERE user_id = ?", (user_id,))
         await db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-        await db.commit()
-        return 1  # Simple return for now
+    await _submit(op)
+    _notify("user_removed", user_id)
+    return 1  # Simple return for now
 
 
 async def delete_payment(payment_id: int) -> bool:
     """Delete a specific payment by ID. Returns True if deleted, False if not found."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("DELETE FROM payments WHERE id = ?", (payment_id,))
-        await db.commit()
-        return cursor.rowcount > 0
-
-
-async def get_payment(payment_id: int) -> Optional[Dict[str, Any]]:
+    async def op(db: aiosqlite.Connection) -> Optional[int]:
+        cursor = await db.execute("SELECT user_id FROM payments WHERE id = ?", (payment_id,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        await db.execute("DELETE FROM payments WHERE id = ?", (payment_id,))
+        await _refresh_coverage(db, row["user_id"])
+        return row["user_id"]
+    user_id = await _submit(op)
+    if user_id is None:
+        return False
+    _notify("payment", user_id)
+    return True
+
+
+async def get_payment(payment_id: int) -> Optional[Payment]:
     """Get a specific payment by ID."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
+    async with _read() as db:
+        return await _fetchone(
+            db, Payment,
             "SELECT id, user_id, amount, months, proof_file_id, paid_at, created_at FROM payments WHERE id = ?",
             (payment_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
 
 
-async def export_all_payments() -> List[tuple]:
-    """Export all payment data with user information."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
+async def export_all_payments(since: Optional[str] = None, until: Optional[str] = None,
+                              chunk_size: int = FETCH_CHUNK_SIZE) -> AsyncIterator[List[tuple]]:
+    """
+    Stream all payment data with user information, newest first, as chunks of tuples.
+    since/until are inclusive YYYY-MM-DD bounds on the date the payment was recorded.
+    """
+    conditions, params = [], []
+    if since:
+        conditions.append("p.created_at >= ?")
+        params.append(since)
+    if until:
+        conditions.append("p.created_at < date(?, '+1 day')")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    async with _read() as db:
+        cursor = await db.execute(f"""
             SELECT p.id, p.user_id, u.username, u.first_name, u.last_name, 
                    p.amount, p.months, p.proof_file_id, p.paid_at
             FROM payments p
             JOIN users u ON p.user_id = u.user_id
-            ORDER BY p.created_at DESC
+            {where}
+            ORDER BY p.created_at DESC, p.id DESC
+        """, params)
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+
+async def payment_stats() -> Dict[str, Any]:
+    """Return user counts and payment totals for the dashboard in one query."""
+    async with _read() as db:
+        cursor = await db.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users) AS total_users,
+                (SELECT COUNT(*) FROM users WHERE muted_until > '') AS muted_users,
+                COUNT(*) AS total_payments,
+                COALESCE(SUM(amount), 0) AS total_revenue,
+                COALESCE(SUM(months), 0) AS total_months
+            FROM payments
         """)
+        stats = dict(await cursor.fetchone())
+        stats["active_users"] = stats["total_users"] - stats["muted_users"]
+        return stats
+
+
+async def monthly_revenue(months: int = 6) -> List[Dict[str, Any]]:
+    """Return payment count, revenue and months sold per calendar month (YYYY-MM), newest first."""
+    async with _read() as db:
+        cursor = await db.execute("""
+            SELECT substr(paid_at, 1, 7) AS month,
+                   COUNT(*) AS payments,
+                   SUM(amount) AS revenue,
+                   SUM(months) AS months_sold
+            FROM payments
+            GROUP BY substr(paid_at, 1, 7)
+            ORDER BY substr(paid_at, 1, 7) DESC
+            LIMIT ?
+        """, (months,))
         rows = await cursor.fetchall()
-        return [tuple(row) for row in rows]
+        return [dict(row) for row in rows]
+
+
+# ---------- Reminder outbox ----------
+# Row lifecycle: pending -> sending -> sent | pending (retry later) | failed.
+# Rows left in 'sending' by a crash become 'unknown' and are never resent.
+async def enqueue_reminders(today: str, first_due: Optional[str], now: float,
+                            timezones: Optional[List[Optional[str]]] = None) -> int:
+    """
+    Queue a reminder for every user due on `today` (same rule as due_user_ids;
+    users who never paid only if first_due is given, as their due date).
+    Keys are (user_id, due_date), so re-running for the same cycle adds nothing.
+    Returns the number of newly queued reminders.
+    """
+    columns = "c.user_id || ':' || {due_date}, c.user_id, {due_date}, :now"
+    select = _due_sql(columns, first_due is not None, timezones)
+    sql = f"INSERT OR IGNORE INTO outbox (idem_key, user_id, due_date, next_attempt_at) {select}"
+    return await _execute_write(sql, {"today": today, "first_due": first_due, "now": now, **_zone_params(timezones)})
+
+
+async def enqueue_user_reminders(due: Iterable[Tuple[int, str]], now: float) -> int:
+    """Queue reminders for explicit (user_id, due_date) pairs; pairs already queued are skipped."""
+    async def op(db: aiosqlite.Connection) -> int:
+        cursor = await db.executemany(
+            "INSERT OR IGNORE INTO outbox (idem_key, user_id, due_date, next_attempt_at) VALUES (?, ?, ?, ?)",
+            [(f"{user_id}:{due_date}", user_id, due_date, now) for user_id, due_date in due]
+        )
+        return cursor.rowcount
+    return await _submit(op)
+
+
+async def claim_outbox(limit: int, now: float) -> List[OutboxItem]:
+    """Mark up to `limit` pending reminders whose retry time has come as 'sending' and return them."""
+    async def op(db: aiosqlite.Connection) -> List[OutboxItem]:
+        items = await _fetchall(db, OutboxItem, """
+            SELECT id, user_id, due_date, attempts + 1 FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at LIMIT ?
+        """, (now, limit))
+        await db.executemany(
+            "UPDATE outbox SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            [(now, item.id) for item in items]
+        )
+        return items
+    return await _submit(op)
+
+
+async def finish_outbox(sent: Iterable[int], retry: Iterable[Tuple[int, float, str]],
+                        failed: Iterable[Tuple[int, str]], now: float):
+    """Record a drained batch: sent ids, (id, next_attempt_at, error) to retry, and (id, error) given up."""
+    async def op(db: aiosqlite.Connection):
+        await db.executemany(
+            "UPDATE outbox SET status = 'sent', last_error = NULL, updated_at = ? WHERE id = ?",
+            [(now, outbox_id) for outbox_id in sent]
+        )
+        await db.executemany(
+            "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+            [(next_at, error, now, outbox_id) for outbox_id, next_at, error in retry]
+        )
+        await db.executemany(
+            "UPDATE outbox SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+            [(error, now, outbox_id) for outbox_id, error in failed]
+        )
+    await _submit(op)
+
+
+async def recover_outbox(now: float) -> int:
+    """
+    Mark reminders left 'sending' by a crash as 'unknown'. They may or may not
+    have been delivered, and resending could remind a user twice in one cycle.
+    Call once at startup, before any drain runs. Returns the number of rows.
+    """
+    return await _execute_write(
+        "UPDATE outbox SET status = 'unknown', last_error = 'interrupted while sending', updated_at = ? "
+        "WHERE status = 'sending'",
+        (now,)
+    )
+
+
+async def queued_reminder_keys() -> set:
+    """Idempotency keys ("user_id:due_date") of every reminder ever queued; those are never queued again."""
+    async with _read() as db:
+        cursor = await db.execute("SELECT idem_key FROM outbox")
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def outbox_stats() -> Dict[str, int]:
+    """Count reminders per outbox status."""
+    async with _read() as db:
+        cursor = await db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+        return {row[0]: row[1] for row in await cursor.fetchall()}
+
@@ -0,0 +1,263 @@
+"""
+Versioned schema migrations for database.py.
+
+The schema version is kept in PRAGMA user_version. At startup migrate()
+applies every Migration newer than that version, in order, each in its own
+transaction through the write queue and bumping user_version in the same
+transaction, so a failed step leaves the database at the previous version.
+
+Data backfills on large tables don't run inside that transaction. A
+Migration may name a Backfill, which is then processed in small batches, each
+committed together with its cursor in the schema_backfills table. An
+interrupted backfill resumes from the last committed batch on the next start,
+and other writers only ever wait for one batch.
+"""
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import aiosqlite
+
+import database as db
+
+BACKFILL_BATCH_SIZE = int(os.getenv("DB_BACKFILL_BATCH_SIZE", "1000"))
+
+
+class Backfill(NamedTuple):
+    name: str
+    # (conn, last key done, batch size) -> last key of this batch, or None when finished
+    batch: Callable[[aiosqlite.Connection, int, int], Awaitable[Optional[int]]]
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+    backfill: Optional[Backfill] = None
+
+
+# ---------- Steps ----------
+# Never edit a step that has shipped; append a new one instead. The first
+# step uses IF NOT EXISTS so databases created before versioning adopt it.
+async def _base_tables(conn: aiosqlite.Connection):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            muted_until TEXT
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            months INTEGER,
+            proof_file_id TEXT,
+            paid_at TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pending_payments (
+            user_id INTEGER PRIMARY KEY,
+            amount REAL,
+            months INTEGER,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+    """)
+
+
+async def _history_indexes(conn: aiosqlite.Connection):
+    # History pages walk (created_at, id) cursors; these replace the earlier
+    # created_at-only indexes of the same purpose.
+    await conn.execute("DROP INDEX IF EXISTS idx_payments_user_created")
+    await conn.execute("DROP INDEX IF EXISTS idx_payments_created")
+    # Per-user history, latest payment and deletes by user.
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_user_keyset ON payments (user_id, created_at DESC, id DESC)"
+    )
+    # Global history and export ordering.
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_keyset ON payments (created_at DESC, id DESC)"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_muted ON users (muted_until)")
+
+
+async def _coverage_indexes(conn: aiosqlite.Connection):
+    # Coverage follows the latest payment by paid_at.
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_user_paid ON payments (user_id, paid_at DESC, id DESC)"
+    )
+    # Covers the dashboard aggregates: totals and per-month GROUP BY.
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_payments_month ON payments (substr(paid_at, 1, 7), amount, months)"
+    )
+
+
+async def _coverage_table(conn: aiosqlite.Connection):
+    # Materialized coverage per user, maintained by every payment write.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_coverage (
+            user_id INTEGER PRIMARY KEY,
+            covered_through TEXT,
+            next_due TEXT,
+            last_payment_id INTEGER,
+            billing_day INTEGER,
+            version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+    """)
+
+
+async def _backfill_coverage(conn: aiosqlite.Connection, after: int, limit: int) -> Optional[int]:
+    return await db._backfill_coverage(conn, after, limit)
+
+
+async def _due_index(conn: aiosqlite.Connection):
+    # The daily reminder job reads only rows with next_due <= today.
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_coverage_next_due ON user_coverage (next_due)")
+
+
+async def _backfill_coverage_rows(conn: aiosqlite.Connection, after: int, limit: int) -> Optional[int]:
+    # Every user gets a coverage row (NULL next_due until their first payment).
+    cursor = await conn.execute(
+        "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (after, limit)
+    )
+    user_ids = [row[0] for row in await cursor.fetchall()]
+    if not user_ids:
+        return None
+    await conn.executemany(
+        "INSERT OR IGNORE INTO user_coverage (user_id, billing_day) VALUES (?, ?)",
+        [(user_id, db._billing_day) for user_id in user_ids]
+    )
+    return user_ids[-1]
+
+
+async def _outbox(conn: aiosqlite.Connection):
+    # Reminders queued by the daily job and drained by reminders.drain_outbox().
+    # idem_key is "user_id:due_date", so a user is queued at most once per cycle.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idem_key TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at REAL
+        )
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, next_attempt_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_user ON outbox (user_id)")
+
+
+async def _user_timezones(conn: aiosqlite.Connection):
+    # NULL means the bot's default TIMEZONE.
+    await conn.execute("ALTER TABLE users ADD COLUMN timezone TEXT")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_timezone ON users (timezone)")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base tables", _base_tables),
+    Migration(2, "history and lookup indexes", _history_indexes),
+    Migration(3, "coverage and dashboard indexes", _coverage_indexes),
+    Migration(4, "user_coverage table", _coverage_table, Backfill("user_coverage", _backfill_coverage)),
+    Migration(5, "due-date index", _due_index, Backfill("user_coverage_rows", _backfill_coverage_rows)),
+    Migration(6, "reminder outbox", _outbox),
+    Migration(7, "user timezones", _user_timezones),
+]
+
+
+# ---------- Engine ----------
+async def _progress_table(conn: aiosqlite.Connection):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            name TEXT PRIMARY KEY,
+            last_key INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+async def _user_version(conn: aiosqlite.Connection) -> int:
+    cursor = await conn.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def current_version() -> int:
+    """Return the schema version recorded in the database."""
+    return await db._submit(_user_version)
+
+
+async def migrate(migrations: List[Migration] = None) -> int:
+    """
+    Apply pending migrations in order, then finish any pending backfills.
+    Returns the schema version reached.
+    """
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+    await db._submit(_progress_table)
+    version = await current_version()
+    for m in migrations:
+        if m.version <= version:
+            continue
+
+        async def op(conn: aiosqlite.Connection, m: Migration = m):
+            # Re-check inside the transaction in case another process got here first.
+            if await _user_version(conn) >= m.version:
+                return
+            await m.apply(conn)
+            if m.backfill:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO schema_backfills (name, last_key, done) VALUES (?, 0, 0)",
+                    (m.backfill.name,)
+                )
+            await conn.execute(f"PRAGMA user_version = {int(m.version)}")
+
+        start = time.perf_counter()
+        await db._submit(op)
+        version = m.version
+        print(f"[migrate] {m.version} {m.name}: {(time.perf_counter() - start) * 1000:.1f} ms")
+    await run_backfills(migrations)
+    return version
+
+
+async def run_backfills(migrations: List[Migration] = None, batch_size: int = None) -> Dict[str, int]:
+    """Run every unfinished backfill to completion. Returns {name: batches run}."""
+    backfills = {m.backfill.name: m.backfill for m in migrations or MIGRATIONS if m.backfill}
+    batch_size = batch_size or BACKFILL_BATCH_SIZE
+    async with db._read() as conn:
+        cursor = await conn.execute("SELECT name, last_key FROM schema_backfills WHERE done = 0 ORDER BY name")
+        pending = [(row["name"], row["last_key"]) for row in await cursor.fetchall()]
+
+    batches = {}
+    for name, last_key in pending:
+        backfill = backfills.get(name)
+        if backfill is None:
+            print(f"[migrate] unknown backfill {name!r}, skipped")
+            continue
+
+        start, resumed_from, count = time.perf_counter(), last_key, 0
+        while last_key is not None:
+            async def op(conn: aiosqlite.Connection, backfill: Backfill = backfill,
+                         after: int = last_key) -> Optional[int]:
+                key = await backfill.batch(conn, after, batch_size)
+                if key is None:
+                    await conn.execute("UPDATE schema_backfills SET done = 1 WHERE name = ?", (backfill.name,))
+                else:
+                    await conn.execute("UPDATE schema_backfills SET last_key = ? WHERE name = ?", (key, backfill.name))
+                return key
+
+            last_key = await db._submit(op)
+            count += 1
+        batches[name] = count
+        resumed = f" (resumed after {resumed_from})" if resumed_from else ""
+        print(f"[migrate] backfill {name}{resumed}: {count} batches in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return batches
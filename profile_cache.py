@@ -0,0 +1,141 @@
+"""
+Last-known member profiles, so ensure_member() stops writing on every message.
+
+ensure_member() used to upsert the sender's profile and read the row back on
+each update. ProfileCache keeps the stored row per user in a size-bounded
+LRU with a TTL: when the incoming username/first/last name match it, both the
+write and the read are skipped. Real changes are written once even if several
+updates from the same user arrive together. Any other write to a user
+(mute, timezone, removal, /addmember) drops their entry through a database
+write listener, so a served row is never older than the last write.
+
+The same rows answer get()/label() lookups by user id, so admin views that
+show one member (e.g. confirming a payment deletion) usually need no query.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import types
+
+import database as db
+
+CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))       # members kept
+CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "3600"))        # seconds before a row is re-read
+
+
+def member_tag(user_id: int, username: Optional[str]) -> str:
+    return f"@{username}" if username else f"ID:{user_id}"
+
+
+def _profile(u: types.User) -> Tuple[str, str, str]:
+    return u.username or "", u.first_name or "", u.last_name or ""
+
+
+class ProfileCache:
+    def __init__(self, size: int = None, ttl: float = None):
+        self.size = size or CACHE_SIZE
+        self.ttl = CACHE_TTL if ttl is None else ttl
+        self.hits = 0
+        self.writes = 0
+        self.writes_avoided = 0
+        self.lookups_cached = 0  # get() calls served without a query
+        self._rows: "OrderedDict[int, Tuple[float, db.User]]" = OrderedDict()  # user_id -> (loaded at, row)
+        self._inflight: Dict[Tuple[int, Tuple[str, str, str]], asyncio.Future] = {}
+        self._versions: Dict[int, int] = {}
+
+    def on_write(self, event: str, user_id: Optional[int]):
+        """database write listener."""
+        if user_id is not None:
+            self._rows.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _get(self, user_id: int, profile: Tuple[str, str, str]) -> Optional[db.User]:
+        entry = self._rows.get(user_id)
+        if entry is None:
+            return None
+        loaded, row = entry
+        if time.monotonic() - loaded > self.ttl:
+            del self._rows[user_id]
+            return None
+        if (row["username"], row["first_name"], row["last_name"]) != profile:
+            return None
+        self._rows.move_to_end(user_id)
+        return row
+
+    def _put(self, row: db.User):
+        self._rows[row["user_id"]] = (time.monotonic(), row)
+        self._rows.move_to_end(row["user_id"])
+        while len(self._rows) > self.size:
+            self._rows.popitem(last=False)
+
+    async def ensure(self, u: types.User) -> db.User:
+        """Make sure the member is stored with this profile and return their row."""
+        profile = _profile(u)
+        row = self._get(u.id, profile)
+        if row is not None:
+            self.hits += 1
+            self.writes_avoided += 1
+            return row
+
+        key = (u.id, profile)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # the same change is already being written: share its result
+            self.writes_avoided += 1
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            await db.upsert_user(u.id, *profile)
+            self.writes += 1
+            # a write landing during the read makes the row stale: don't cache it then
+            version = self._versions.get(u.id, 0)
+            row = await db.get_user(u.id)
+            if row is not None and self._versions.get(u.id, 0) == version:
+                self._put(row)
+            pending.set_result(row)
+            return row
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # retrieved here; waiters re-raise it
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def get(self, user_id: int) -> Optional[db.User]:
+        """The member's stored row, from the cache while it's fresh, otherwise read (and cached)."""
+        entry = self._rows.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self._rows.move_to_end(user_id)
+            self.lookups_cached += 1
+            return entry[1]
+        version = self._versions.get(user_id, 0)
+        row = await db.get_user(user_id)
+        if row is not None and self._versions.get(user_id, 0) == version:
+            self._put(row)
+        return row
+
+    async def label(self, user_id: int) -> str:
+        """How admin views show a member: @username, or their id."""
+        row = await self.get(user_id)
+        return member_tag(user_id, row["username"] if row else None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "writes": self.writes,
+            "writes_avoided": self.writes_avoided,
+            "lookups_cached": self.lookups_cached,
+            "cached": len(self._rows),
+        }
+
+
+profiles = ProfileCache()
+db.add_write_listener(profiles.on_write)
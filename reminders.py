@@ -0,0 +1,241 @@
+"""
+Concurrent, rate-limited reminder delivery.
+
+dispatch() sends to many chats with a bounded number of requests in flight,
+behind token buckets sized to the Bot API limits: about 30 messages per
+second overall and about one per second per chat. The buckets are shared by
+every dispatch() in the process, so the daily job, event timers and retries
+stay under the limits together. A 429 (TelegramRetryAfter) pauses all sending
+for the requested time and retries the message.
+Network and server errors are retried with exponential backoff, and any
+other error (e.g. the user blocked the bot) fails that chat only.
+
+drain_outbox() feeds dispatch() from the persistent outbox table in batches,
+so reminders survive restarts: failed sends are retried later with backoff,
+and each (user, due date) is delivered at most once. Drains run one at a time.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+import database as db
+
+GLOBAL_RATE = float(os.getenv("REMINDER_RATE", "25"))           # messages/second across all chats
+CHAT_RATE = float(os.getenv("REMINDER_CHAT_RATE", "1"))         # messages/second to one chat
+CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "16"))      # requests in flight
+MAX_RETRIES = int(os.getenv("REMINDER_MAX_RETRIES", "3"))
+RETRY_BACKOFF = 0.5  # seconds, doubled per attempt for network/server errors
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))           # reminders claimed per batch
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))         # drains before giving up
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "300"))   # seconds, doubled per attempt
+MAX_CHAT_BUCKETS = 10000  # idle per-chat buckets are dropped beyond this
+
+
+class TokenBucket:
+    """Token bucket for asyncio tasks: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds` (server-requested backoff)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """The Bot API limits as token buckets: one across all chats and one per chat."""
+
+    def __init__(self, global_rate: float, chat_rate: float):
+        self.global_bucket = TokenBucket(global_rate, burst=1)  # paced, no initial burst
+        self.chat_rate = chat_rate
+        self._chats: Dict[int, TokenBucket] = {}
+
+    def chat(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune()
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, burst=1)
+        return bucket
+
+    def _prune(self):
+        """Forget chats whose bucket has refilled; a fresh bucket behaves the same."""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chats.items()):
+            bucket._refill(now)
+            if bucket._tokens >= bucket.burst and now >= bucket._paused_until:
+                del self._chats[chat_id]
+
+
+_limiter: Optional[RateLimiter] = None   # created on first use, after any rate overrides
+_drain_lock: Optional[asyncio.Lock] = None  # created on the serving loop
+
+
+def shared_limiter() -> RateLimiter:
+    """The limiter every dispatch() uses unless given its own rates."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(GLOBAL_RATE, CHAT_RATE)
+    return _limiter
+
+
+class DispatchStats:
+    __slots__ = ("total", "sent", "failed", "retried", "duration", "errors", "sent_ids", "failures")
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.duration = 0.0
+        self.errors: List[Tuple[int, str]] = []  # (chat_id, error), first few only
+        self.sent_ids = set()
+        self.failures: Dict[int, Tuple[str, bool]] = {}  # chat_id -> (error, worth retrying later)
+
+    def add(self, other: "DispatchStats"):
+        """Fold another run (e.g. the next outbox batch) into this one."""
+        self.total += other.total
+        self.sent += other.sent
+        self.failed += other.failed
+        self.retried += other.retried
+        self.duration += other.duration
+        self.errors.extend(other.errors[:10 - len(self.errors)])
+        self.sent_ids |= other.sent_ids
+        self.failures.update(other.failures)
+
+    def summary(self) -> str:
+        rate = self.sent / self.duration if self.duration else 0.0
+        lines = [
+            "📬 *Reminder run finished*",
+            f"• Sent: {self.sent}/{self.total}",
+            f"• Failed: {self.failed}",
+            f"• Retried: {self.retried}",
+            f"• Duration: {self.duration:.1f}s ({rate:.1f} msg/s)",
+        ]
+        lines.extend(f"• `{chat_id}: {error}`" for chat_id, error in self.errors)
+        return "\n".join(lines)
+
+
+async def dispatch(chat_ids: Iterable[int], send: Callable[[int], Awaitable[None]],
+                   concurrency: int = None, global_rate: float = None, chat_rate: float = None,
+                   max_retries: int = None, limiter: RateLimiter = None) -> DispatchStats:
+    """
+    Call send(chat_id) for every chat under the rate limits. send() should raise on failure.
+    Uses the shared limiter unless given one, or its own rates.
+    """
+    chat_ids = list(chat_ids)
+    concurrency = concurrency or CONCURRENCY
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    if limiter is None:
+        if global_rate or chat_rate:
+            limiter = RateLimiter(global_rate or GLOBAL_RATE, chat_rate or CHAT_RATE)
+        else:
+            limiter = shared_limiter()
+    global_bucket = limiter.global_bucket
+    stats = DispatchStats(len(chat_ids))
+    pending = iter(chat_ids)  # shared by the workers
+
+    async def deliver(chat_id: int):
+        bucket = limiter.chat(chat_id)
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+            await global_bucket.acquire()
+            try:
+                await send(chat_id)
+                stats.sent += 1
+                stats.sent_ids.add(chat_id)
+                return
+            except TelegramRetryAfter as e:
+                # Flood control applies to the bot, not just this chat.
+                global_bucket.pause(e.retry_after)
+                error, transient = e, True
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+                error, transient = e, True
+            except Exception as e:
+                error, transient = e, False
+                break
+            if attempt < max_retries:
+                stats.retried += 1
+        stats.failed += 1
+        stats.failures[chat_id] = (str(error), transient)
+        if len(stats.errors) < 10:
+            stats.errors.append((chat_id, str(error).replace("`", "'")))
+        print(f"[reminder] failed to send to {chat_id}: {error}")
+
+    async def worker():
+        for chat_id in pending:
+            await deliver(chat_id)
+
+    start = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(chat_ids)))))
+    stats.duration = time.monotonic() - start
+    return stats
+
+
+async def drain_outbox(send: Callable[[int], Awaitable[None]], batch_size: int = None,
+                       concurrency: int = None) -> DispatchStats:
+    """
+    Deliver pending outbox reminders whose retry time has come, batch_size at a
+    time, each batch through dispatch(). Sent rows are marked 'sent'; rows that
+    failed on a network, server or flood error go back to 'pending' with
+    exponential backoff until OUTBOX_MAX_ATTEMPTS, anything else is 'failed'.
+    A drain that starts while another is running waits for it to finish.
+    """
+    global _drain_lock
+    if _drain_lock is None:
+        _drain_lock = asyncio.Lock()
+    async with _drain_lock:
+        return await _drain(send, batch_size or OUTBOX_BATCH_SIZE, concurrency)
+
+
+async def _drain(send: Callable[[int], Awaitable[None]], batch_size: int, concurrency: Optional[int]) -> DispatchStats:
+    started = time.time()  # rows rescheduled by this drain are left for the next one
+    stats = DispatchStats(0)
+    while True:
+        items = await db.claim_outbox(batch_size, started)
+        if not items:
+            return stats
+        # Several open cycles for one user (e.g. an old retry and today's) get one message.
+        user_ids = list(dict.fromkeys(item.user_id for item in items))
+        batch = await dispatch(user_ids, send, concurrency=concurrency)
+        stats.add(batch)
+
+        now = time.time()
+        sent, retry, failed = [], [], []
+        for item in items:
+            if item.user_id in batch.sent_ids:
+                sent.append(item.id)
+                continue
+            error, transient = batch.failures[item.user_id]
+            if transient and item.attempts < OUTBOX_MAX_ATTEMPTS:
+                retry.append((item.id, now + OUTBOX_RETRY_BACKOFF * 2 ** (item.attempts - 1), error))
+            else:
+                failed.append((item.id, error))
+        await db.finish_outbox(sent, retry, failed, now)
+        if retry:
+            print(f"[reminder] {len(retry)} reminder(s) rescheduled for retry")
@@ -1,55 +1,201 @@
 import asyncio
-from datetime import datetime, date
+import heapq
+from datetime import datetime, date, time as dtime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from typing import Callable, Awaitable, List
-from database import all_users, list_payments
-from utils import next_billing_start, iso_to_date
-
-async def users_due(billing_day:int, tz:ZoneInfo) -> List[int]:
-    """Return list of user_ids who should get a reminder today."""
-    today_local = datetime.now(tz).date()
-    result = []
-    users = await all_users()
-    for u in users:
-        muted_until = None
-        if u["muted_until"]:
-            muted_until = iso_to_date(u["muted_until"])
-            if today_local < muted_until:
-                continue  # still muted
-
-        # Determine last covered date from payments
-        payments = await list_payments(u["user_id"], limit=1000)
-        if not payments:
-            # New user: first due is the nearest billing anchor >= today
-            due = date(today_local.year, today_local.month, 1)
-            day = min(billing_day, (date(due.year, (due.month % 12)+1, 1) - date(due.year, due.month, 1)).days)
-            due = due.replace(day=day)
-            if today_local >= due:
-                result.append(u["user_id"])
+from typing import Callable, Awaitable, Dict, Iterable, List, Optional, Set, Tuple
+import time
+import database as db
+from coverage_service import coverage, first_due, CoverageStatus
+from reminders import drain_outbox, DispatchStats
+from utils import add_months_anchor, get_zone, local_today
+
+BUCKET_MINUTES = 15  # run_daily is called this often; every UTC offset is a multiple of it
+
+async def users_due(billing_day:int, tz:ZoneInfo, timezones:Optional[List[Optional[str]]] = None,
+                    today:Optional[date] = None) -> List[int]:
+    """Return list of user_ids who should get a reminder today (or on `today`; optionally only users in `timezones`)."""
+    today_local = today or datetime.now(tz).date()
+    return await coverage.due(today_local, billing_day, timezones)
+
+async def enqueue_due(billing_day:int, today_local:date, timezones:Optional[List[Optional[str]]] = None) -> int:
+    """Queue the reminders due on today_local in the outbox; users already queued for their due date are skipped."""
+    unpaid_due = first_due(today_local, billing_day)
+    return await db.enqueue_reminders(
+        today_local.isoformat(),
+        unpaid_due.isoformat() if today_local >= unpaid_due else None,
+        time.time(),
+        timezones
+    )
+
+def zone_buckets(zones:Iterable[Optional[str]], default_tz:str, now:datetime) -> Dict[timedelta, List[Optional[str]]]:
+    """Group user timezones (None: default_tz) by their UTC offset at `now`."""
+    buckets: Dict[timedelta, List[Optional[str]]] = {}
+    for name in zones:
+        offset = now.astimezone(get_zone(name or default_tz)).utcoffset()
+        buckets.setdefault(offset, []).append(name)
+    return buckets
+
+async def run_daily(remind_fn: Callable[[int], Awaitable[None]], billing_day:int, tzname:str,
+                    hour:int, now:Optional[datetime] = None) -> DispatchStats:
+    """
+    Every BUCKET_MINUTES: for each UTC-offset bucket of user timezones whose
+    local time has just reached `hour`, queue that bucket's due reminders (one
+    indexed query per bucket), then deliver the outbox concurrently under the
+    Bot API rate limits (see reminders.py). Users without a timezone use tzname.
+    """
+    now = now or datetime.now(timezone.utc)
+    fired = False
+    for offset, zones in zone_buckets(await db.user_timezones(), tzname, now).items():
+        local = now + offset
+        if local.hour != hour or local.minute >= BUCKET_MINUTES:
             continue
+        fired = True
+        queued = await enqueue_due(billing_day, local.date(), zones)
+        names = ", ".join(name or tzname for name in zones)
+        print(f"[scheduler] UTC{_format_offset(offset)} ({names}): {queued} reminder(s) queued")
+    if not fired:
+        return DispatchStats(0)
+    return await drain_outbox(remind_fn)
+
+def _format_offset(offset: timedelta) -> str:
+    minutes = int(offset.total_seconds()) // 60
+    sign = "+" if minutes >= 0 else "-"
+    return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+async def run_due(remind_fn: Callable[[int], Awaitable[None]], due: List[Tuple[int, str]]) -> DispatchStats:
+    """Queue reminders for (user_id, due_date) pairs and deliver the outbox."""
+    await db.enqueue_user_reminders(due, time.time())
+    return await drain_outbox(remind_fn)
+
+class ReminderTimers:
+    """
+    Event-driven alternative to the daily job: one timer per user, set for
+    REMINDER_HOUR in the user's timezone on the day they become due (after any mute). Timers
+    live in a heap served by a single task. Write listeners reschedule the
+    affected user; entries superseded that way are skipped when popped, and
+    dropped in one pass once they outnumber the live timers two to one.
+    """
+    MAX_SLEEP = 300  # seconds; bounds drift between the wall clock and asyncio's clock
+
+    def __init__(self, fire: Callable[[List[Tuple[int, str]]], Awaitable[None]],
+                 billing_day:int, tzname:str, hour:int):
+        self.fire = fire
+        self.billing_day = billing_day
+        self.tzname = tzname  # for users without a timezone
+        self.hour = hour
+        # (fire_at epoch, user_id, version, due_date ISO, never paid, user's timezone)
+        self._heap: List[Tuple[float, int, int, str, bool, str]] = []
+        self._versions: Dict[int, int] = {}
+        self._fired: Dict[int, str] = {}  # user_id -> due date already handed to fire()
+        self._dirty: Set[int] = set()
+        self._reload = False
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _at(self, day: date, tzname: str) -> float:
+        return datetime.combine(day, dtime(self.hour), get_zone(tzname)).timestamp()
+
+    def _push(self, s: CoverageStatus):
+        version = self._versions.get(s.user_id, 0) + 1
+        self._versions[s.user_id] = version
+        tzname = s.timezone or self.tzname
+        day, due = s.next_reminder(local_today(tzname), self.billing_day)
+        if self._fired.get(s.user_id) == due.isoformat():
+            if s.next_due is not None:
+                del self._versions[s.user_id]  # already reminded for this due date
+                return
+            day = due = add_months_anchor(due, 1, self.billing_day)  # never paid: due again next anchor
+        heapq.heappush(self._heap, (self._at(day, tzname), s.user_id, version, due.isoformat(), s.next_due is None, tzname))
+
+    async def _load(self, user_ids: Optional[List[int]] = None):
+        if user_ids is None:
+            statuses = await coverage.all()
+            self._heap, self._versions = [], {}
+            for s in statuses:
+                self._push(s)
+            return
+        for user_id in user_ids:
+            s = await coverage.get(user_id)
+            if s is None:
+                self._versions.pop(user_id, None)  # removed: its entries no longer match
+                self._fired.pop(user_id, None)
+            else:
+                self._push(s)
+        self._compact()
+
+    def _compact(self):
+        """Rebuild the heap from the live entries if superseded ones make up over two thirds of it."""
+        if len(self._heap) - len(self._versions) <= 2 * len(self._versions):
+            return
+        self._heap = [e for e in self._heap if self._versions.get(e[1]) == e[2]]
+        heapq.heapify(self._heap)
+
+    async def start(self) -> int:
+        """Restore a timer for every user from the stored coverage, then serve them. Returns the count."""
+        self._wake = asyncio.Event()
+        await self._load()
+        self._task = asyncio.create_task(self._run())
+        return len(self._heap)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def on_write(self, event: str, user_id: Optional[int]):
+        """database write listener: reschedule the user (everyone after a rebuild)."""
+        if user_id is None:
+            self._reload = True
+        else:
+            self._dirty.add(user_id)
+        if self._wake is not None:
+            self._wake.set()
+
+    def set_billing_day(self, billing_day: int):
+        """Re-anchor every timer on a new billing day (/setday)."""
+        self.billing_day = billing_day
+        self.on_write("rebuild", None)
+
+    def pending(self) -> int:
+        return len(self._versions)
+
+    async def _run(self):
+        while True:
+            if self._reload:
+                self._reload = False
+                self._dirty.clear()
+                await self._load()
+            elif self._dirty:
+                dirty, self._dirty = list(self._dirty), set()
+                await self._load(dirty)
+
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                _, user_id, version, due_date, never_paid, tzname = heapq.heappop(self._heap)
+                if self._versions.get(user_id) != version:
+                    continue
+                due.append((user_id, due_date))
+                self._fired[user_id] = due_date
+                if never_paid:
+                    # unpaid users are due again at every billing anchor
+                    anchor = add_months_anchor(date.fromisoformat(due_date), 1, self.billing_day)
+                    heapq.heappush(self._heap, (self._at(anchor, tzname), user_id, version, anchor.isoformat(), True, tzname))
+                else:
+                    del self._versions[user_id]  # next timer is set when a payment moves next_due
+            if due:
+                try:
+                    await self.fire(due)
+                except Exception as e:
+                    print(f"[scheduler] reminder event for {len(due)} user(s) failed: {e}")
+                continue
 
-        # Compute coverage: sort by paid_at ascending and roll forward
-        payments_sorted = sorted(payments, key=lambda p: p["paid_at"])
-        # Start with the date they first paid
-        last_covered = iso_to_date(payments_sorted[0]["paid_at"])
-        last_covered = last_covered.replace(day=1)  # baseline; will be advanced by months
-        # Fold payments in chronological order
-        from utils import compute_coverage_until  # late import to avoid cycle
-        for p in payments_sorted:
-            paid_on = iso_to_date(p["paid_at"])
-            last_covered = compute_coverage_until(paid_on, int(p["months"]), billing_day)
-        # Next due is next billing anchor AFTER coverage-through
-        due = next_billing_start(last_covered, billing_day)
-        if today_local >= due:
-            result.append(u["user_id"])
-    return result
-
-async def run_daily(remind_fn: Callable[[int], Awaitable[None]], billing_day:int, tzname:str):
-    tz = ZoneInfo(tzname)
-    due_ids = await users_due(billing_day, tz)
-    for uid in due_ids:
-        try:
-            await remind_fn(uid)
-        except Exception as e:
-            # log to stdout; container will capture logs
-            print(f"[reminder] failed to send to {uid}: {e}")
+            timeout = min(self._heap[0][0] - now, self.MAX_SLEEP) if self._heap else self.MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
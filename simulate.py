@@ -0,0 +1,131 @@
+"""
+Dry run of the reminder pipeline over future dates.
+
+Loads every user's coverage status and the outbox keys once (a snapshot),
+then steps day by day from a start date: who would be reminded each day,
+with the same rules as the live jobs (due or overdue, mute window, first due
+date of users who never paid, one reminder per user and due date). Pending
+reminders sit in a heap ordered by day, so each simulated day only touches
+the users reminded on it instead of re-scanning everyone. Nothing is sent and
+nothing is written; new payments during the range are not predicted.
+
+    python simulate.py [--db database.db] [--from 2026-01-01] [--days 365] [--show 10]
+
+The CLI runs against a copy of the database file. Admins can run the same
+simulation on live data with /simulate [days].
+"""
+import argparse
+import asyncio
+import heapq
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import database as db
+from coverage_service import CoverageStatus, coverage
+from utils import add_months_anchor, local_today
+
+MAX_DAYS = 730  # upper bound for /simulate
+
+
+class SimDay(NamedTuple):
+    day: date
+    user_ids: List[int]
+    seconds: float  # time spent computing this day
+
+
+class ReminderSimulation:
+    def __init__(self, statuses: Iterable[CoverageStatus], billing_day: int, queued: Set[str], start: date):
+        self.billing_day = billing_day
+        self.start = start
+        self.labels: Dict[int, str] = {}
+        # (day, user_id, due date, never paid)
+        self._heap: List[Tuple[date, int, date, bool]] = []
+        for s in statuses:
+            self.labels[s.user_id] = f"@{s.username}" if s.username else str(s.user_id)
+            day, due = s.next_reminder(start, billing_day)
+            if f"{s.user_id}:{due.isoformat()}" in queued:
+                if s.next_due is not None:
+                    continue  # already reminded for this due date; nothing else until they pay
+                day = due = add_months_anchor(due, 1, billing_day)
+            self._heap.append((day, s.user_id, due, s.next_due is None))
+        heapq.heapify(self._heap)
+
+    def run(self, days: int) -> Iterator[SimDay]:
+        for offset in range(days):
+            day = self.start + timedelta(days=offset)
+            started = time.perf_counter()
+            reminded = []
+            while self._heap and self._heap[0][0] <= day:
+                _, user_id, due, never_paid = heapq.heappop(self._heap)
+                reminded.append(user_id)
+                if never_paid:
+                    anchor = add_months_anchor(due, 1, self.billing_day)
+                    heapq.heappush(self._heap, (anchor, user_id, anchor, True))
+            yield SimDay(day, reminded, time.perf_counter() - started)
+
+
+async def simulate(days: int, billing_day: int, start: Optional[date] = None,
+                   tzname: str = "Europe/Chisinau") -> Tuple[ReminderSimulation, List[SimDay], float]:
+    """Simulate `days` days from `start` (today in tzname) on the open database. Returns (simulation, days, load seconds)."""
+    started = time.perf_counter()
+    statuses = await coverage.all()
+    queued = await db.queued_reminder_keys()
+    sim = ReminderSimulation(statuses, billing_day, queued, start or local_today(tzname))
+    loaded = time.perf_counter() - started
+    # stepping is pure CPU: keep it off the event loop so the bot stays responsive
+    result = await asyncio.to_thread(lambda: list(sim.run(days)))
+    return sim, result, loaded
+
+
+def report(sim: ReminderSimulation, result: List[SimDay], loaded: float, show: int = 10) -> str:
+    """Plain-text report: one line per day with reminders, then totals."""
+    lines = []
+    for d in result:
+        if not d.user_ids:
+            continue
+        names = ", ".join(sim.labels[uid] for uid in d.user_ids[:show])
+        more = f" (+{len(d.user_ids) - show} more)" if len(d.user_ids) > show else ""
+        lines.append(f"{d.day.isoformat()}  {len(d.user_ids):>5}  {d.seconds * 1000:6.2f} ms  {names}{more}")
+    total = sum(len(d.user_ids) for d in result)
+    compute = sum(d.seconds for d in result)
+    lines.append(
+        f"{len(result)} days from {result[0].day.isoformat() if result else sim.start.isoformat()}: "
+        f"{total} reminders on {sum(1 for d in result if d.user_ids)} days; "
+        f"snapshot {loaded * 1000:.1f} ms, stepping {compute * 1000:.2f} ms "
+        f"({compute / len(result) * 1e6 if result else 0:.1f} µs/day)"
+    )
+    return "\n".join(lines)
+
+
+async def main(db_path: str, start: Optional[date], days: int, show: int):
+    billing_day = int(os.getenv("BILLING_DAY", "1"))
+    tzname = os.getenv("TIMEZONE", "Europe/Chisinau")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Snapshot: migrations and coverage rebuilds in init_db must not touch the real file.
+        snapshot = Path(tmp) / "snapshot.db"
+        with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as src, \
+                closing(sqlite3.connect(snapshot)) as dst:
+            src.backup(dst)
+        db.DB_PATH = snapshot
+        await db.init_db(billing_day)
+        try:
+            sim, result, loaded = await simulate(days, billing_day, start, tzname)
+        finally:
+            await db.close_db()
+    print(report(sim, result, loaded, show))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=str(db.DB_PATH), help="database file (default: DB_PATH)")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first simulated day (default: today)")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--show", type=int, default=10, help="users listed per day")
+    args = parser.parse_args()
+    asyncio.run(main(args.db, args.start, args.days, args.show))
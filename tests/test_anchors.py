@@ -0,0 +1,74 @@
+"""
+Closed-form billing anchors in utils.py against the previous relativedelta /
+month-by-month implementations (reference copies in benchmarks/bench_anchors.py).
+"""
+import calendar
+import random
+from datetime import date
+
+import pytest
+
+import utils
+from benchmarks.bench_anchors import (ref_add_months_anchor, ref_compute_coverage_until, ref_days_in_month,
+                                      ref_next_billing_start)
+
+# common, leap, century leap and century non-leap years
+YEARS = (1999, 2000, 2023, 2024, 2100)
+OFFSETS = (0, 1, 2, 11, 12, 13, 24, 25, 48, 120, 240)
+
+
+def _edge_dates() -> list:
+    """Month ends, leap days and year boundaries."""
+    dates = []
+    for y in YEARS:
+        dates += [date(y, 1, 1), date(y, 1, 31), date(y, 2, 28), date(y, 3, 1), date(y, 4, 30), date(y, 12, 31)]
+        if calendar.isleap(y):
+            dates.append(date(y, 2, 29))
+    return dates
+
+
+@pytest.mark.parametrize("year", YEARS)
+def test_days_in_month(year):
+    for month in range(1, 13):
+        assert utils.days_in_month(year, month) == ref_days_in_month(year, month)
+
+
+@pytest.mark.parametrize("billing_day", range(1, 32))
+def test_edge_dates(billing_day):
+    for d in _edge_dates():
+        assert utils.next_billing_start(d, billing_day) == ref_next_billing_start(d, billing_day), d
+        for months in OFFSETS:
+            assert utils.add_months_anchor(d, months, billing_day) == \
+                ref_add_months_anchor(d, months, billing_day), (d, months)
+            assert utils.compute_coverage_until(d, months, billing_day) == \
+                ref_compute_coverage_until(d, months, billing_day), (d, months)
+
+
+@pytest.mark.parametrize("anchor, months, billing_day, expected", [
+    (date(2024, 1, 31), 1, 31, date(2024, 2, 29)),   # leap February
+    (date(2023, 1, 31), 1, 31, date(2023, 2, 28)),
+    (date(2024, 1, 30), 1, 30, date(2024, 2, 29)),
+    (date(2023, 1, 29), 1, 29, date(2023, 2, 28)),
+    (date(2100, 1, 29), 1, 29, date(2100, 2, 28)),   # century, not a leap year
+    (date(2000, 1, 29), 1, 29, date(2000, 2, 29)),   # century leap year
+    (date(2024, 2, 29), 1, 31, date(2024, 3, 31)),   # clamped anchor springs back
+    (date(2024, 3, 31), 1, 31, date(2024, 4, 30)),
+    (date(2023, 11, 30), 3, 30, date(2024, 2, 29)),  # across a year boundary
+    (date(2024, 1, 31), 49, 31, date(2028, 2, 29)),  # multi-year offset onto the next leap day
+])
+def test_clamped_anchors(anchor, months, billing_day, expected):
+    assert utils.add_months_anchor(anchor, months, billing_day) == expected
+    assert ref_add_months_anchor(anchor, months, billing_day) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_cases(seed):
+    rng = random.Random(seed)
+    lo, hi = date(1900, 1, 1).toordinal(), date(2200, 12, 31).toordinal()
+    for _ in range(2000):
+        d = date.fromordinal(rng.randint(lo, hi))
+        months, billing_day = rng.randint(0, 240), rng.randint(1, 31)
+        case = (d, months, billing_day)
+        assert utils.add_months_anchor(*case) == ref_add_months_anchor(*case), case
+        assert utils.compute_coverage_until(*case) == ref_compute_coverage_until(*case), case
+        assert utils.next_billing_start(d, billing_day) == ref_next_billing_start(d, billing_day), case
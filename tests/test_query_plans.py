@@ -0,0 +1,8 @@
+"""Query-plan regressions in database.py (see benchmarks/check_query_plans.py) fail the test run."""
+import asyncio
+
+from benchmarks import check_query_plans
+
+
+def test_no_query_plan_regressions():
+    assert asyncio.run(check_query_plans.main()) == 0
@@ -0,0 +1,100 @@
+"""
+Concurrent update processing with per-user ordering.
+
+aiogram starts every incoming update as its own task (polling) or background
+request (webhook) with nothing in between: one user's updates can overtake
+each other (a proof photo handled before the /pay that set up the pending
+payment), and a burst of slow admin reports competes with everyone else for
+the loop and the database. UpdateScheduler is an outer middleware on
+dp.update that gives each sender a FIFO lane: a user's updates run strictly
+one after another in arrival order, while different users run in parallel
+on at most UPDATE_WORKERS workers. Updates without a sender aren't ordered.
+
+stats() reports queue depths for the admin dashboard.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))  # updates processed at once, across users
+
+
+class _Lane:
+    """One sender's updates: the lock is held by the update running, depth counts it and those queued behind."""
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+
+class UpdateScheduler(BaseMiddleware):
+    def __init__(self, workers: int = None):
+        self.workers = workers or UPDATE_WORKERS
+        self.running = 0
+        self.waiting_worker = 0
+        self.processed = 0
+        self.max_depth = 0
+        self.wait_seconds = 0.0  # total time updates spent queued
+        self._lanes: Dict[int, _Lane] = {}
+        self._slots: Optional[asyncio.Semaphore] = None  # created on the serving loop
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user else chat.id if chat else None
+        queued = time.monotonic()
+        if key is None:
+            return await self._run(handler, event, data, queued)
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.depth += 1
+        self.max_depth = max(self.max_depth, lane.depth)
+        try:
+            async with lane.lock:
+                return await self._run(handler, event, data, queued)
+        finally:
+            lane.depth -= 1
+            if not lane.depth:
+                del self._lanes[key]
+
+    async def _run(self, handler, event, data, queued: float):
+        self.waiting_worker += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting_worker -= 1
+        self.wait_seconds += time.monotonic() - queued
+        self.running += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.running -= 1
+            self.processed += 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        queued = sum(lane.depth - lane.lock.locked() for lane in self._lanes.values())
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting_worker": self.waiting_worker,
+            "waiting_user": queued,  # behind an earlier update from the same user
+            "users": len(self._lanes),
+            "deepest": max((lane.depth for lane in self._lanes.values()), default=0),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "avg_wait_ms": self.wait_seconds / self.processed * 1000 if self.processed else 0.0,
+        }
+
+
+update_scheduler = UpdateScheduler()
@@ -1,37 +1,42 @@
 from datetime import datetime, date, timedelta
-from dateutil.relativedelta import relativedelta
+from functools import lru_cache
 from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
 import math
+import calendar
+
+import numpy as np
+
+# Month lengths for (common, leap) years, indexed by month - 1.
+_MONTH_DAYS = (
+    (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+)
+
+def _anchor(month_index: int, billing_day: int) -> date:
+    """Billing anchor of a month given as year * 12 + month - 1, clamped to the month length."""
+    y, m0 = divmod(month_index, 12)
+    return date(y, m0 + 1, min(billing_day, _MONTH_DAYS[calendar.isleap(y)][m0]))
 
 def next_billing_start(last_covered_until: date, billing_day:int) -> date:
     """
     Given that coverage is valid THROUGH last_covered_until (inclusive),
     return the next due date (billing cycle anchor) based on billing_day.
     """
-    # Next cycle anchor on billing_day after last_covered_until
-    candidate = date(last_covered_until.year, last_covered_until.month, 1)
-    # Move to next month if we're past or on billing day in this month
-    # Determine current month's billing anchor
-    curr_anchor = candidate.replace(day=min(billing_day, days_in_month(candidate.year, candidate.month)))
-    if last_covered_until < curr_anchor:
-        return curr_anchor
-    # else move forwards month-by-month until after last_covered_until
-    d = curr_anchor
-    while d <= last_covered_until:
-        d = add_months_anchor(d, 1, billing_day)
-    return d
+    # This month's anchor if coverage ends before it, otherwise next month's
+    # (always later, since it falls in the following month).
+    month_index = last_covered_until.year * 12 + last_covered_until.month - 1
+    anchor = _anchor(month_index, billing_day)
+    if last_covered_until < anchor:
+        return anchor
+    return _anchor(month_index + 1, billing_day)
 
 def add_months_anchor(anchor_date: date, months:int, billing_day:int) -> date:
-    target = anchor_date + relativedelta(months=+months)
     # clamp day to last day of month if billing_day > month length
-    return target.replace(day=min(billing_day, days_in_month(target.year, target.month)))
+    return _anchor(anchor_date.year * 12 + anchor_date.month - 1 + months, billing_day)
 
 def days_in_month(y:int, m:int) -> int:
-    if m==12:
-        nxt = date(y+1,1,1)
-    else:
-        nxt = date(y,m+1,1)
-    return (nxt - date(y,m,1)).days
+    return _MONTH_DAYS[calendar.isleap(y)][m - 1]
 
 def apply_advance_months(start_anchor: date, months:int, billing_day:int) -> date:
     """Return coverage-through date after adding months to start_anchor (each month covers until the day before next anchor)."""
@@ -41,14 +46,46 @@ def apply_advance_months(start_anchor: date, months:int, billing_day:int) -> dat
 
 def compute_coverage_until(last_payment_date: date, months:int, billing_day:int) -> date:
     """Coverage from payment applies starting at the next billing anchor on/after payment date."""
-    first_anchor = date(last_payment_date.year, last_payment_date.month, 1)
-    first_anchor = first_anchor.replace(day=min(billing_day, days_in_month(first_anchor.year, first_anchor.month)))
-    if last_payment_date < first_anchor:
-        start = first_anchor
-    else:
-        # start at next anchor if paying after billing day
-        start = add_months_anchor(first_anchor, 1, billing_day)
-    return apply_advance_months(start, months, billing_day)
+    start = last_payment_date.year * 12 + last_payment_date.month - 1
+    # start at next anchor if paying on/after this month's billing day
+    if last_payment_date >= _anchor(start, billing_day):
+        start += 1
+    # Coverage lasts until the day BEFORE the end anchor
+    return _anchor(start + months, billing_day) - timedelta(days=1)
+
+# ---------- Vectorized coverage ----------
+# Array counterparts of compute_coverage_until/next_billing_start for bulk work
+# (rebuilding every user's coverage). Dates are handled as integer month
+# indexes (months since 1970-01) plus day offsets; results match the scalar
+# functions exactly.
+def _month_start(month_index: np.ndarray) -> np.ndarray:
+    return month_index.astype("datetime64[M]").astype("datetime64[D]")
+
+def _anchor_day(month_index: np.ndarray, billing_day: int) -> np.ndarray:
+    """billing_day clamped to the length of each month."""
+    days = (_month_start(month_index + 1) - _month_start(month_index)).astype(np.int64)
+    return np.minimum(billing_day, days)
+
+def coverage_arrays(paid: np.ndarray, months: np.ndarray, billing_day: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized compute_coverage_until + next_billing_start.
+    paid: datetime64[D] payment dates, months: ints. Returns (covered_through, next_due) as datetime64[D].
+    """
+    paid = np.asarray(paid, dtype="datetime64[D]")
+    paid_month = paid.astype("datetime64[M]").astype(np.int64)
+    paid_day = (paid - _month_start(paid_month)).astype(np.int64) + 1
+    # Coverage starts at this month's anchor, or next month's if paid on/after it.
+    start_month = paid_month + (paid_day >= _anchor_day(paid_month, billing_day))
+    end_month = start_month + np.asarray(months, dtype=np.int64)
+    next_due = _month_start(end_month) + (_anchor_day(end_month, billing_day) - 1)
+    return next_due - 1, next_due
+
+def latest_per_group(keys: np.ndarray) -> np.ndarray:
+    """Mask of the first row of each run of equal keys (rows sorted newest-first within a key)."""
+    keys = np.asarray(keys)
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return first
 
 def pretty_money(amount: float) -> str:
     # Keep 2 decimals max without trailing zeros excess
@@ -63,3 +100,13 @@ def parse_username_or_id(s: str) -> Optional[int]:
 
 def iso_to_date(iso_str: str) -> date:
     return datetime.fromisoformat(iso_str).date()
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    """Shared ZoneInfo for an IANA name; raises ZoneInfoNotFoundError (a KeyError) if unknown."""
+    return ZoneInfo(name)
+
+def local_today(tzname: str, now: Optional[datetime] = None) -> date:
+    """Today's date in the given timezone (at `now`, an aware datetime, if given)."""
+    zone = get_zone(tzname)
+    return now.astimezone(zone).date() if now else datetime.now(zone).date()
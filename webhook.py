@@ -0,0 +1,127 @@
+"""
+Webhook mode (BOT_MODE=webhook): Telegram POSTs updates to an embedded aiohttp
+server instead of the bot long-polling getUpdates.
+
+Each request must carry the secret token Telegram echoes back in
+X-Telegram-Bot-Api-Secret-Token. Accepted updates are acknowledged at once
+and processed in the background; how many run at once, and in which order
+per user, is up to update_scheduler.UpdateScheduler. Telegram opens up to
+WEBHOOK_MAX_CONNECTIONS parallel requests, so a reverse proxy in front can
+terminate TLS and forward to WEBHOOK_HOST:WEBHOOK_PORT.
+
+On SIGTERM/SIGINT the server stops listening, answers requests still
+arriving on open connections with 503 (Telegram redelivers them later) and
+waits up to WEBHOOK_DRAIN_SECONDS for accepted updates to finish.
+"""
+import asyncio
+import os
+import signal
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")          # public base URL; empty = don't call setWebhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")                 # 1-256 chars of A-Z a-z 0-9 _ -
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # parallel requests from Telegram (1-100)
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "30"))
+
+
+class UpdateWebhook(SimpleRequestHandler):
+    """SimpleRequestHandler with update counters and a graceful drain."""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str,
+                 drain_seconds: float = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.drain_seconds = WEBHOOK_DRAIN_SECONDS if drain_seconds is None else drain_seconds
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self._draining = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining:
+            return web.Response(status=503, text="Shutting down")
+        return await super().handle(request)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        response = await super()._handle_request_background(bot, request)
+        self.accepted += 1
+        return response
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await super()._background_feed_update(bot, update)
+        except Exception as e:
+            self.failed += 1
+            print(f"[webhook] update {update.get('update_id')} failed: {e}")
+        finally:
+            self.processed += 1
+
+    async def drain(self):
+        """Refuse new updates and wait for the accepted ones; cancel whatever is left after drain_seconds."""
+        self._draining = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        print(f"[webhook] draining {len(tasks)} update(s)")
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_seconds)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            print(f"[webhook] {len(pending)} update(s) cancelled after {self.drain_seconds:g}s")
+
+    async def close(self):
+        await self.drain()
+        await super().close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "in_flight": len(self._background_feed_update_tasks),
+        }
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, **data: Any):
+    """Serve updates over the webhook until SIGTERM/SIGINT, then drain and return."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set when BOT_MODE=webhook.")
+    handler = UpdateWebhook(dispatcher, bot, WEBHOOK_SECRET, **data)
+    app = web.Application()
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot, **data)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    print(f"[webhook] listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        print(f"[webhook] registered {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+    try:
+        await stop.wait()
+    finally:
+        # stops listening, then on_shutdown drains the handler and closes the bot session
+        await runner.cleanup()
+        s = handler.stats()
+        print(f"[webhook] stopped: {s['accepted']} accepted, {s['processed']} processed, {s['failed']} failed")